@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import errno
+import glob
+import json
+import math
+import os
+import platform
+import threading
+import time
+
+
+# Wait for a child and collect its resource usage with wait4
+# Tuple: (exit status, negative signal number if killed; resource usage)
+def wait_rusage(proc):
+    while True:
+        try:
+            _, status, rusage = os.wait4(proc.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return proc.returncode, rusage
+
+
+# Format a duration in seconds as a short human-readable string
+def fmt_time(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%dh%02dm%02ds" % (hours, minutes, seconds)
+    elif minutes:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+
+""" Collects a record for each executed job (timing, CPU usage, peak memory,
+exit status) grouped by operation, and writes them as a JSON run manifest.
+Records are dicts with the following keys:
+- cmd, cwd, log : command line, working directory and log file path
+- bench : names of the benchmarks run by the job
+- queued, start, end : timestamps (seconds since the epoch)
+- wall, utime, stime : elapsed and CPU times in seconds
+- maxrss : peak resident set size in bytes
+- status : exit code, or negative signal number if killed
+- cpu, node : dedicated core and NUMA node, or None if not pinned
+- fail : failure code, or None if the job succeeded """
+class RunManifest(object):
+    def __init__(self, run_id, args):
+        self._lock = threading.Lock()
+        self._data = {
+            "id"    : run_id,
+            "host"  : platform.node(),
+            "set"   : args.set[0],
+            "suite" : args.benchsuite,
+            "arch"  : args.arch,
+            "ops"   : []
+        }
+        return
+
+    def newOp(self, mode, max_proc):
+        op = {"mode": mode, "max_proc": max_proc, "start": time.time(),
+              "end": None, "jobs": []}
+        with self._lock:
+            self._data["ops"].append(op)
+        return op
+
+    def addJob(self, record):
+        with self._lock:
+            self._data["ops"][-1]["jobs"].append(record)
+        return
+
+    def endOp(self):
+        with self._lock:
+            self._data["ops"][-1]["end"] = time.time()
+        return
+
+    def lastOp(self):
+        return self._data["ops"][-1] if self._data["ops"] else None
+
+    # Write the manifest atomically (it is rewritten after each operation)
+    def write(self, path):
+        tmp_path = path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w") as out:
+                json.dump(self._data, out, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+        return
+
+
+# Compute throughput statistics of an operation as printable lines
+def op_summary(op, slowest=5):
+    jobs = op["jobs"]
+    if not jobs or not op["end"]:
+        return []
+    makespan = op["end"] - op["start"]
+    wall = sum(j["wall"] for j in jobs)
+    cpu  = sum(j["utime"] + j["stime"] for j in jobs)
+    wait = sum(j["start"] - j["queued"] for j in jobs) / len(jobs)
+    slots = min(op["max_proc"], len(jobs))
+    lines = []
+    lines.append("|___ elapsed time\t\t\t= %s" % fmt_time(makespan))
+    lines.append("|___ core-hours used (cpu/wall)\t= %.2f / %.2f" % (
+        cpu / 3600., wall / 3600.))
+    if makespan > 0:
+        lines.append("|___ core utilization\t\t= %d%%" % (
+            100. * cpu / (slots * makespan)))
+    lines.append("|___ average queue wait\t\t= %s" % fmt_time(wait))
+    lines.append("|___ slowest jobs:")
+    for j in sorted(jobs, key=lambda x: x["wall"], reverse=True)[:slowest]:
+        lines.append("     |___ %s (%s, %d MB)" % (j["log"],
+            fmt_time(j["wall"]), j["maxrss"] // 2**20))
+    return lines
+
+
+# Nearest-rank percentile of a list of values
+def percentile(values, p):
+    values = sorted(values)
+    rank = int(math.ceil(p / 100. * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+# Collect the wall times of the successful jobs from previous run manifests
+# Dict: (mode, benchmarks) -> list of wall times in seconds
+def load_history(out_dir):
+    history = {}
+    for m_path in glob.glob(os.path.join(out_dir, "manifest_*.json")):
+        try:
+            with open(m_path, "r") as m_file:
+                data = json.load(m_file)
+        except (IOError, OSError, ValueError):
+            # Ignore unreadable or partially written manifests
+            continue
+        for op in data.get("ops", []):
+            for j in op["jobs"]:
+                if j["status"] == 0 and not j["fail"] and j.get("bench"):
+                    key = (op["mode"], "+".join(j["bench"]))
+                    history.setdefault(key, []).append(j["wall"])
+    return history
+
+
+""" Decides the maximum execution time of each job. In order of priority:
+1. explicit limit for any of the benchmarks of the job (the largest applies)
+2. automatic limit from the history of the same mode and benchmarks, i.e.
+   the given percentile of the previous wall times multiplied by a factor
+   (only if there are at least min_runs successful runs)
+3. explicit limit for the mode
+4. explicit global limit
+5. default limit for the mode
+Limits are expressed in seconds, None means no limit. """
+class TimeoutPolicy(object):
+    def __init__(self, limits, defaults, factor=None, history=None,
+                 pct=99, min_runs=3):
+        self._limits   = limits
+        self._defaults = defaults
+        self._factor   = factor
+        self._history  = history if history else {}
+        self._pct      = pct
+        self._min_runs = min_runs
+        return
+
+    def _benchLimit(self, benches):
+        limit = None
+        for key, value in self._limits.items():
+            for b in benches:
+                if key == b or key == b.split('.')[0]:
+                    limit = max(limit, value) if limit else value
+        return limit
+
+    def get(self, mode, benches):
+        limit = self._benchLimit(benches)
+        if limit:
+            return limit
+        runs = self._history.get((mode, "+".join(benches)), [])
+        if self._factor and len(runs) >= self._min_runs:
+            return percentile(runs, self._pct) * self._factor
+        if mode in self._limits:
+            return self._limits[mode]
+        if "" in self._limits:
+            return self._limits[""]
+        return self._defaults.get(mode)
+
+
+""" Tracks the progress of an operation and estimates its remaining time
+from the expected wall time of each job: the median of the previous runs of
+the same mode and benchmarks (see load_history), or else the median of the
+jobs already completed in this operation. The remaining work is spread over
+the slots in use, but the operation cannot end before its longest running
+job. Jobs are identified by a key, and can be queued again when retried. """
+class ProgressEstimator(object):
+    def __init__(self, mode, history=None):
+        self._start   = time.time()
+        # Expected wall time by benchmarks, from the history
+        self._medians = dict((k[1], percentile(v, 50)) for k, v in
+            (history or {}).items() if k[0] == mode and v)
+        # Benchmarks of the queued jobs, and start time of the running ones
+        self._queued  = {}
+        self._running = {}
+        # Expected time of the queued jobs with history, number of the others
+        self._known   = 0.
+        self._unknown = 0
+        # Wall times of the successful jobs of this operation
+        self._walls   = []
+        self._done    = 0
+        self._lock    = threading.Lock()
+        return
+
+    # Add (sign 1) or remove (sign -1) a queued job from the totals
+    def _account(self, benches, sign):
+        expected = self._medians.get("+".join(benches))
+        if expected is None:
+            self._unknown += sign
+        else:
+            self._known += sign * expected
+        return
+
+    def queue(self, key, benches):
+        with self._lock:
+            self._queued[key] = benches
+            self._account(benches, 1)
+        return
+
+    def start(self, key):
+        with self._lock:
+            benches = self._queued.pop(key, None)
+            if benches is not None:
+                self._account(benches, -1)
+            self._running[key] = (time.time(), benches or ())
+        return
+
+    # Remove a queued job which will not be executed
+    def cancel(self, key):
+        with self._lock:
+            benches = self._queued.pop(key, None)
+            if benches is not None:
+                self._account(benches, -1)
+        return
+
+    def finish(self, key, wall, success):
+        with self._lock:
+            self._running.pop(key, None)
+            self._done += 1
+            if success:
+                self._walls.append(wall)
+        return
+
+    # Estimated seconds to the end of the operation, or None if unknown
+    def eta(self, slots):
+        now = time.time()
+        with self._lock:
+            fallback = percentile(self._walls, 50) if self._walls else None
+            left = []
+            for start, benches in self._running.values():
+                expected = self._medians.get("+".join(benches), fallback)
+                if expected is None:
+                    return None
+                left.append(max(expected - (now - start), 0.))
+            if self._unknown and fallback is None:
+                return None
+            work = self._known + self._unknown * (fallback or 0.) + sum(left)
+        return max(work / max(slots, 1), max(left) if left else 0.)
+
+    # Short description of the progress, with completed jobs per hour
+    def status(self, slots):
+        elapsed = time.time() - self._start
+        eta = self.eta(slots)
+        return "%d running, %.1f jobs/h, ETA %s" % (len(self._running),
+            self._done * 3600. / elapsed if elapsed > 0 else 0.,
+            fmt_time(eta) if eta is not None else "unknown")
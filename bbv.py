@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import gzip
+import os
+
+# Local modules
+from postproc import open_any
+
+
+# Parse an interval of a BBV file ("T:<bb id>:<count> :<bb id>:<count> ...",
+# the format of both valgrind exp-bbv and gem5 simpoint-profile) into a dict
+def parse_interval(line, counts):
+    for field in line[1:].split():
+        bb, count = field.lstrip(":").split(":")
+        counts[int(bb)] = counts.get(int(bb), 0) + int(count)
+    return counts
+
+
+# Format an interval of a BBV file, by basic block id
+def format_interval(counts):
+    return "T" + " ".join(":%d:%d" % (bb, counts[bb])
+        for bb in sorted(counts)) + "\n"
+
+
+# Derive the BBVs of a coarser interval size from a BBV file, summing each
+# group of factor consecutive intervals in a single streaming pass (the last
+# group is dropped if incomplete, as a profiling run at the coarser size
+# would not report it). The output file is gzip-compressed if its name ends
+# with .gz, and replaced only once complete
+# Return the number of intervals written
+def coarsen_bbv(src_path, dest_path, factor):
+    tmp_path = "%s.%d.tmp" % (dest_path, os.getpid())
+    if dest_path.endswith(".gz"):
+        out = gzip.open(tmp_path, "wb")
+    else:
+        out = open(tmp_path, "wb")
+    written, grouped, counts = 0, 0, {}
+    with out:
+        with open_any(src_path) as bbv_file:
+            for l in bbv_file:
+                l = l.split("#")[0].strip()
+                if not l.startswith("T"):
+                    continue
+                parse_interval(l, counts)
+                grouped += 1
+                if grouped == factor:
+                    out.write(format_interval(counts).encode("ascii"))
+                    written += 1
+                    grouped, counts = 0, {}
+    os.rename(tmp_path, dest_path)
+    return written
@@ -4,12 +4,12 @@ __author__ = "Tommaso Marinelli"
 __email__  = "tommarin@ucm.es"
 
 import argparse
-from datetime import datetime, timedelta
-import io
+import hashlib
 import os
 import platform
+import re
 import shlex
-import shutil
+import signal
 import sys
 import time
 import threading
@@ -22,8 +22,26 @@ else:
     import subprocess
 
 # Local modules
+from accounting import ProgressEstimator, RunManifest, TimeoutPolicy, \
+    load_history, op_summary, percentile, wait_rusage
+import benchsuites
+from jobs import Job, raw_command
+from logcapture import LogCapture
+from metrics import MetricsExporter
+from mixes import generate_mixes
+from monitor import ResourceSampler, get_rss
+from placement import CorePlacer
+from plan import ExecutionPlan, merge_results, parse_shard, shard_manifest
+from scheduler import JobQueue, host_mem_min, select_victim, spawn_interval
+from staging import Stage
+from postproc import DeletionQueue, PostProcessor, find_any, \
+    folder_weight, open_any, weighted_stats
+from sampling import ConvergenceTracker, SamplingMonitor, stats_cpi
+from simpoints import default_dim, default_seed, simpoint_grid
+from tracecache import TraceCache
 from simclass import BBVGeneration, SPGeneration, CptGeneration, \
-    CptSimulation, TraceGeneration, TraceReplay, FullSimulation, MemProfile
+    CptSimulation, TraceGeneration, TraceReplay, FullSimulation, MemProfile, \
+    SampledSimulation, bench_folders, sizenum
 import simparams
 
 valid_short_uuid = False
@@ -40,6 +58,10 @@ warnings = []
 count_pids = 0
 # Total number of terminated processes (succeeded and failed)
 count_term = 0
+# Total number of re-queued processes
+count_retry = 0
+# Total number of queued processes cancelled before being spawned
+count_skip = 0
 # Lock for processes list/counter update
 lock_pids = threading.Lock()
 # Lock for failed processes dict/counter update
@@ -48,6 +70,41 @@ lock_fail = threading.Lock()
 sp_pids = []
 # Dict which contains pending failed subprocesses with failure cause
 sp_fail = {}
+# Dict which contains the deadline of the running subprocesses, if any
+sp_deadline = {}
+# Default time limits in seconds for each mode
+default_timeouts = {
+    "cpt_sim" : 6 * 3600
+}
+# Actions to take before re-queuing a failed process, by failure cause:
+# - mem  : double the memory size of the simulated system
+# - slot : wait for enough free host memory and lower the concurrency
+retry_policy = {
+    "oom"     : "mem",
+    "alloc"   : "slot",
+    "hostmem" : "slot"
+}
+# Prefixes of the job folders whose statistics are combined by weight
+weighted_prefixes = {
+    "cpt_sim" : "cpt.mix_",
+    "trc_sim" : "trace.simpoint_"
+}
+# Seconds between two updates of the progress bar while no process ends
+progress_interval = 30
+# Resource sampler for the running subprocesses
+sampler = None
+# Exporter of the campaign metrics, if requested
+metrics = None
+# Seconds between two updates of the metrics
+metrics_interval = 15
+# Seconds between two checks of the estimates of the sampled simulations
+sampling_interval = 5
+# Run manifest with the accounting of all the executed jobs
+manifest = None
+# Index of the selected benchmark suite
+catalog = None
+# Execution plan being generated, if any
+exec_plan = None
 # Shutdown flag
 shutdown = False
 
@@ -63,19 +120,45 @@ def path(s):
     return os.path.expanduser(s)
 
 
+# Duration type (e.g. 90, 45m, 1h30m, 2d)
+def duration(s):
+    match = re.match(r'^(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$', s)
+    if not s or not match:
+        raise argparse.ArgumentTypeError("invalid duration: %s" % s)
+    d, h, m, sec = [int(g) if g else 0 for g in match.groups()]
+    return ((d * 24 + h) * 60 + m) * 60 + sec
+
+
+# Time limit type, optionally restricted to a mode or benchmark (KEY=DURATION)
+def timeout(s):
+    key, _, value = s.rpartition("=")
+    return (key, duration(value))
+
+
+# Comma-separated list of integers type (e.g. 10,20,30)
+def int_list(s):
+    try:
+        return [int(v) for v in s.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid list of integers: %s" % s)
+
+
 # Print a simple progress bar
 # Original source: https://stackoverflow.com/a/45868571
-def progress_bar(total, progress, prefix = ""):
+def progress_bar(total, progress, prefix = "", suffix = ""):
     if prefix:
         prefix += " "
-    bar_length, status = 40, ""
+    bar_length, status = (20 if suffix else 40), ""
+    if suffix:
+        # Pad the suffix to overwrite longer previous ones
+        suffix = ("(%d/%d, %s)" % (progress, total, suffix)).ljust(50)
     progress = float(progress) / float(total)
     if progress >= 1.:
         progress, status = 1, "\r\n"
     block = int(round(bar_length * progress))
-    text = "\r{}[{}] {:.0f}% {}".format(prefix,
+    text = "\r{}[{}] {:.0f}% {}{}".format(prefix,
         "#" * block + "-" * (bar_length - block), round(progress * 100, 0),
-        status)
+        suffix, status)
     sys.stdout.write(text)
     sys.stdout.flush()
 
@@ -179,25 +262,10 @@ def get_params(args, b_name):
 
 # Get benchmark subset parameters
 def get_ss_params(b_name, b_set):
-    benchlist_subset = benchlist.subset.get(b_set)
-    benchlist_params = benchlist.params.get(b_set)
-    benchlist_input  = benchlist.input.get(b_set)
-    if any(v is None for v in
-        (benchlist_subset, benchlist_params, benchlist_input)):
+    arguments = catalog.subsets(b_name, b_set)
+    if arguments is None:
         log("error: couldn't find benchmark set")
         exit(1)
-    arguments = []
-    b_params  = benchlist_params.get(b_name, "")
-    b_input   = benchlist_input.get(b_name, "")
-    if b_name in benchlist_subset:
-        for i, ss in enumerate(benchlist_subset[b_name]):
-            b_subset = ss + "_" + b_set
-            arguments.append((b_subset,
-                b_params[i] if isinstance(b_params, tuple) else "",
-                b_input[i]  if isinstance(b_input, tuple) else ""))
-    else:
-        b_subset = b_set
-        arguments.append((b_subset, b_params, b_input))
     return arguments
 
 
@@ -217,19 +285,6 @@ def get_host_mem():
     return 0
 
 
-# Get process Resident Set Size (RSS) from /proc/[pid]/stat
-def get_rss(pid):
-    try:
-        with open(os.path.join("/proc", str(pid), "stat"), 'r') as pidfile:
-            stat = pidfile.readline()
-            rss = int(stat.split(' ')[23])
-            return rss
-    except IOError:
-        log("error: unable to read from /proc")
-        exit(3)
-    return 0
-
-
 # Add a process to the failed list
 def fail(pid, cause):
     global sp_fail
@@ -240,44 +295,95 @@ def fail(pid, cause):
 
 
 # Watchdog which prevents host system memory saturation or process stall
-def watchdog(limit_time):
+def watchdog():
     # Memory monitoring
     total, avail = get_host_mem()
-    if float(avail) / float(total) < 0.1 and any(sp_pids):
+    if float(avail) / float(total) < host_mem_min and any(sp_pids):
         # Find the child which is using more memory
-        largest_mem = [0, 0]
+        usage = {}
         for pid in sp_pids:
             # Avoid re-targeting a dead child
             proc_dir = os.path.join("/proc", str(pid))
             if pid not in sp_fail and os.path.isdir(proc_dir):
-                mem = get_rss(pid)
-                if mem > largest_mem[1]:
-                    largest_mem[0] = pid
-                    largest_mem[1] = mem
-        if largest_mem[0] != 0:
+                # Use the last sample if available, avoiding extra reads
+                mem = sampler.rss(pid) if sampler else 0
+                usage[pid] = mem if mem else get_rss(pid)
+        target = select_victim(usage)
+        if target is not None:
             # Take note and kill it
-            target = largest_mem[0]
             fail(target, "hostmem")
             os.kill(target, 9)
             # Wait some more time
             time.sleep(4)
 
-    # Time monitoring
-    current_time = datetime.now()
-    if limit_time == True:
-        for pid in sp_pids:
-            # Avoid re-targeting a dead child
-            proc_dir = os.path.join("/proc", str(pid))
-            if pid not in sp_fail and os.path.isdir(proc_dir):
-                limit = timedelta(hours = 6)
-                ptime = datetime.fromtimestamp(os.path.getmtime(proc_dir))
-                if current_time - ptime > limit:
-                    # Take note and kill it
-                    fail(pid, "timeout")
-                    os.kill(pid, 9)
+    # Time monitoring (deadlines are computed from the spawn time)
+    current_time = time.time()
+    for pid, deadline in list(sp_deadline.items()):
+        # Avoid re-targeting a dead child
+        proc_dir = os.path.join("/proc", str(pid))
+        if (current_time > deadline and pid not in sp_fail and
+            os.path.isdir(proc_dir)):
+            # Take note and kill it
+            fail(pid, "timeout")
+            os.kill(pid, 9)
     return
 
 
+# Check a log file for known strings indicating a bad execution
+# Return the failure cause, or None if none is found
+def classify_log(logpath):
+    with open_any(logpath) as logfile:
+        return classify_output(logfile.read())
+
+
+# Check the output of a process for known strings indicating a bad execution
+# Return the failure cause, or None
+def classify_output(log):
+    if "fatal: Could not mmap" in log:
+        return "alloc"
+    elif "fatal: Out of memory" in log:
+        return "oom"
+    elif "fatal: Can't load checkpoint file" in log:
+        return "parse"
+    elif "fatal: syscall" in log:
+        return "syscall"
+    elif "panic: Unrecognized/invalid instruction" in log:
+        return "instr"
+    elif "panic: Tried to write unmapped address" in log:
+        return "unmapad"
+    elif "panic: Page table fault" in log:
+        return "ptfault"
+    elif "gem5 has encountered a segmentation fault!" in log:
+        return "sigsegv"
+    elif "Attempt to free invalid pointer" in log:
+        return "invptr"
+    elif "--- BEGIN LIBC BACKTRACE ---" in log:
+        return "unknown"
+    elif "Fortran runtime error" in log:
+        return "fortran"
+    elif ("Resuming from SimPoint" in log and
+            "Done running SimPoint!" not in log):
+        return "incompl"
+    return None
+
+
+# Point the trace parameters of a command to the local trace cache
+# Tuple: (new command, list of cached traces to release after the execution)
+def cache_traces(cmd, cache):
+    new_cmd, acquired = [], []
+    for param in cmd:
+        key, _, value = param.partition("=")
+        if key in ("--inst-trace-file", "--data-trace-file"):
+            local = []
+            for t in value.split(';'):
+                local.append(cache.acquire(t))
+                if local[-1] != t:
+                    acquired.append(t)
+            param = "%s=%s" % (key, ';'.join(local))
+        new_cmd.append(param)
+    return new_cmd, acquired
+
+
 # Generate SGE job scripts from spawn list
 def gen_sge_job(spawn_list, args):
     global count_pids
@@ -292,14 +398,13 @@ def gen_sge_job(spawn_list, args):
     log("generating sge job scripts")
     for s in spawn_list:
         job = unparsed
-        split_cmd, in_name, tmp_dir, log_filepath = s
         # Reconstruct command string
-        cmd = cmd_join(split_cmd)
+        cmd = cmd_join(s.argv())
         job_id = "%s%04d" % (short_uuid, count_pids)
         # Replace placeholders with real parameters
-        job = job.replace("[EXEDIR]", tmp_dir)
+        job = job.replace("[EXEDIR]", s.work_path)
         job = job.replace("[JOBNAME]", job_id)
-        job = job.replace("[LOGPATH]", log_filepath)
+        job = job.replace("[LOGPATH]", s.log_path)
         job = job.replace("[COMMAND]", cmd)
         # Write the job file
         with open(os.path.join(jobs_dir, "%s.sh" % job_id), "w") as out:
@@ -309,8 +414,136 @@ def gen_sge_job(spawn_list, args):
 
 
 # Spawn all the programs in the spawn list and control the execution
-def execute(spawn_list, args, sem, limit_time=False):
+def execute(spawn_list, args, sem, mode):
     global shutdown
+    global sampler
+    global metrics
+
+    # Early stop of the groups of simpoints whose weighted result has
+    # converged, running the heaviest simpoints first
+    tracker = None
+    if args.cpt_error and mode in weighted_prefixes:
+        tracker = ConvergenceTracker(args.cpt_error, args.cpt_min,
+            args.cpt_weight)
+        spawn_list = converge_order(spawn_list)
+        for s in spawn_list:
+            group, weight = simpoint_group(s)
+            if group is not None:
+                tracker.expect(group, weight)
+    # Maximum execution time of each process
+    history = load_history(args.out_dir)
+    policy = TimeoutPolicy(dict(args.timeout), default_timeouts,
+        args.auto_timeout, history)
+    # Remaining time estimation, from the same history
+    progress = ProgressEstimator(mode, history)
+    for s in spawn_list:
+        progress.queue(s.log_path, s.benches)
+    # Queue of processes to be spawned, failed ones can be added again
+    sp_queue = JobQueue(spawn_list, retry_policy, args.retry)
+    # Dedicated cores for the processes, if requested
+    placer = None
+    numactl, taskset = cmd_exists("numactl"), cmd_exists("taskset")
+    if args.pin and not numactl and not taskset:
+        log("warning: numactl or taskset needed for --pin, ignoring it")
+    elif args.pin:
+        placer = CorePlacer(args.no_smt, numactl, taskset)
+        if placer.size() < args.max_proc:
+            log("warning: only %d cores available for %d processes, " % (
+                placer.size(), args.max_proc) + "the others are not pinned")
+    # Compression of the output artifacts, if requested
+    postproc = None
+    if args.compress:
+        tools = [t for t in ("nice", "pigz", "zstd") if cmd_exists(t)]
+        if args.compress == "zstd" and "zstd" not in tools:
+            log("warning: zstd utility not found, using gzip instead")
+        postproc = PostProcessor(args.compress,
+            args.compress_files.split(','), args.compress_jobs,
+            args.compress_threads, tools)
+    # Background deletion of the temporary and discarded folders
+    deleter = DeletionQueue(os.path.join(args.out_dir,
+        ".trash_%s" % short_uuid), [t for t in ("nice", "ionice", "rm")
+        if cmd_exists(t)])
+    # Shared cache of decompressed traces, if requested
+    tracecache = None
+    if args.trace_cache and mode == "trc_sim":
+        cache_dir = args.cache_dir
+        if cache_dir is None:
+            cache_dir = ("/dev/shm" if os.path.isdir("/dev/shm")
+                else args.out_dir)
+        tracecache = TraceCache(os.path.join(cache_dir,
+            "bench5_traces_%s" % short_uuid), sizenum(args.trace_cache))
+
+    # Keep the log of a failed attempt before re-queuing the process
+    def keep_log(s, attempt):
+        global count_retry
+
+        log_path = find_any(s.log_path)
+        os.rename(log_path, log_path.replace(s.log_path,
+            "%s.%d" % (s.log_path, attempt), 1))
+        with lock_pids:
+            count_retry += 1
+        return
+
+    # Metrics of the campaign, if requested (shared by all the operations)
+    if (args.metrics or args.metrics_port) and metrics is None:
+        try:
+            metrics = MetricsExporter(args.metrics, args.metrics_port,
+                {"run": short_uuid, "host": platform.node()})
+        except (IOError, OSError) as e:
+            log("error: unable to serve the metrics: %s" % e)
+            exit(1)
+    # Benchmarks of the running processes, by pid
+    job_benches = {}
+    # Estimate of the CPI of the sampled simulations, to stop them early
+    smp_monitor = None
+    if mode == "smp_sim" and args.smp_error > 0:
+        smp_monitor = SamplingMonitor(args.smp_error, args.smp_conf,
+            args.smp_min)
+
+    # Update the metrics with the current state and write them
+    def export_metrics():
+        total, avail = get_host_mem()
+        with lock_pids:
+            pids = list(sp_pids)
+        metrics.set("bench5_jobs_running", len(pids), {"mode": mode})
+        metrics.set("bench5_jobs_queued", len(sp_queue), {"mode": mode})
+        metrics.set("bench5_host_memory_bytes", total * 1024,
+            {"kind": "total"})
+        metrics.set("bench5_host_memory_bytes", avail * 1024,
+            {"kind": "available"})
+        metrics.set("bench5_host_memory_headroom_ratio",
+            float(avail) / float(total) - host_mem_min)
+        # Total memory by benchmark, as labelling each process would create
+        # a new series for every job of the campaign
+        usage = {}
+        for pid in pids:
+            rss = sampler.rss(pid) if sampler else 0
+            bench = "+".join(job_benches.get(pid, ()))
+            usage[bench] = usage.get(bench, 0) + (rss if rss else
+                get_rss(pid))
+        metrics.clear("bench5_job_rss_bytes")
+        for bench, rss in usage.items():
+            metrics.set("bench5_job_rss_bytes", rss,
+                {"mode": mode, "bench": bench})
+        try:
+            metrics.write()
+        except (IOError, OSError) as e:
+            log("warning: unable to write the metrics: %s" % e)
+        return
+
+    # Show the progress bar with the running jobs and the estimated time
+    def show_progress():
+        progress_bar(len(spawn_list) + count_retry, count_term + count_skip,
+            "[bench5]",
+            progress.status(args.max_proc - sp_queue.held()))
+        return
+
+    # Take the first queued process whose memory needs can be satisfied
+    def next_job():
+        if not sp_queue:
+            return None
+        avail = get_host_mem()[1] * 1024 if sp_queue.needsMemory() else 0
+        return sp_queue.pop(avail, bool(sp_pids))
 
     # Create a thread for each child, to release the semaphore after execution
     # (this is needed because with subprocess it is only possible to wait for
@@ -319,6 +552,7 @@ def execute(spawn_list, args, sem, limit_time=False):
     def run_in_thread(s):
         global count_pids
         global count_term
+        global count_skip
         global sp_pids
         global sp_fail
 
@@ -328,105 +562,209 @@ def execute(spawn_list, args, sem, limit_time=False):
             sem.release()
             return
 
-        cmd, in_name, work_path, logpath = s
-        with open(logpath, "w") as logfile:
+        slot_time = time.time()
+        # Build the argument vector only now
+        cmd = s.argv()
+        in_name, work_path, logpath, benches = (s.in_name, s.work_path,
+            s.log_path, s.benches)
+        # Take a dedicated core, if any
+        slot = placer.acquire() if placer else None
+        exec_cmd = (placer.prefix(slot) + cmd) if slot else cmd
+        # Use the local copies of the traces, if any
+        traces = []
+        if tracecache:
+            exec_cmd, traces = cache_traces(exec_cmd, tracecache)
+        start_time = time.time()
+        # Capture the output through a pipe, if requested
+        if args.log_cap:
+            logfile = LogCapture(logpath, sizenum(args.log_cap),
+                sizenum(args.log_tail))
+        else:
+            logfile = open(logpath, "w")
+        with logfile:
             if in_name:
                 in_file = open(os.path.join(work_path, in_name), "rb", 0)
-                proc = subprocess.Popen(cmd, cwd=work_path, stdin=in_file,
-                    stdout=logfile, stderr=subprocess.STDOUT)
+                proc = subprocess.Popen(exec_cmd, cwd=work_path,
+                    stdin=in_file, stdout=logfile, stderr=subprocess.STDOUT)
             else:
-                proc = subprocess.Popen(cmd, cwd=work_path, stdout=logfile,
-                    stderr=subprocess.STDOUT)
+                proc = subprocess.Popen(exec_cmd, cwd=work_path,
+                    stdout=logfile, stderr=subprocess.STDOUT)
             pid = proc.pid
+            if args.log_cap:
+                logfile.spawned()
             with lock_pids:
                 count_pids += 1
                 sp_pids.append(pid)
+            progress.start(logpath)
+            if metrics:
+                job_benches[pid] = benches
+                metrics.observe("bench5_spawn_latency_seconds",
+                    time.time() - slot_time, {"mode": mode})
+            # Set the time limit, if any
+            limit = policy.get(mode, benches)
+            if limit:
+                sp_deadline[pid] = start_time + limit
+            # Record the resource usage next to the log file
+            sampler.register(pid, None if args.no_res_log else
+                os.path.splitext(logpath)[0] + ".res")
+            if smp_monitor:
+                smp_monitor.register(pid, s.cmd.outdir)
             # Necessary: sometimes the thread is idling inside the routine
             if (shutdown and
                 os.path.exists(os.path.join("/proc", str(pid)))):
                 os.kill(pid, 9)
-            proc.wait()
-            # Flush internal buffers before closing the logfile
-            logfile.flush()
-            os.fsync(logfile.fileno())
+            # Reap the child and collect its resource usage
+            status, rusage = wait_rusage(proc)
+            end_time = time.time()
+            sampler.unregister(pid)
+            if smp_monitor:
+                smp_monitor.unregister(pid)
+            if placer:
+                placer.release(slot)
+            for t in traces:
+                tracecache.release(t)
+            if args.log_cap:
+                # Wait for the end of the output
+                logfile.close()
+            else:
+                # Flush internal buffers before closing the logfile
+                logfile.flush()
+                os.fsync(logfile.fileno())
             if in_name:
                 in_file.close()
 
         if pid not in sp_fail and not shutdown:
             # Check logfile for known strings indicating a bad execution
-            with io.open(logpath, 'r', encoding='utf-8',
-                         errors='replace') as logfile:
-                log = logfile.read()
-                if "fatal: Could not mmap" in log:
-                    fail(pid, "alloc")
-                elif "fatal: Out of memory" in log:
-                    fail(pid, "oom")
-                elif "fatal: Can't load checkpoint file" in log:
-                    fail(pid, "parse")
-                elif "fatal: syscall" in log:
-                    fail(pid, "syscall")
-                elif "panic: Unrecognized/invalid instruction" in log:
-                    fail(pid, "instr")
-                elif "panic: Tried to write unmapped address" in log:
-                    fail(pid, "unmapad")
-                elif "panic: Page table fault" in log:
-                    fail(pid, "ptfault")
-                elif "gem5 has encountered a segmentation fault!" in log:
-                    fail(pid, "sigsegv")
-                elif "Attempt to free invalid pointer" in log:
-                    fail(pid, "invptr")
-                elif "--- BEGIN LIBC BACKTRACE ---" in log:
-                    fail(pid, "unknown")
-                elif "Fortran runtime error" in log:
-                    fail(pid, "fortran")
-                elif ("Resuming from SimPoint" in log and
-                        "Done running SimPoint!" not in log):
-                    fail(pid, "incompl")
+            cause = (classify_output(logfile.text()) if args.log_cap
+                else classify_log(logpath))
+            if cause:
+                fail(pid, cause)
+
+        # Re-queue the process if the failure cause allows it
+        action = None
+        cause = sp_fail.get(pid)
+        if cause and not shutdown:
+            action = sp_queue.requeue(s, cause, rusage.ru_maxrss * 1024,
+                keep_log)
+        if action:
+            # Keep the folders for the next attempt, which is not a failure yet
+            with lock_fail:
+                del sp_fail[pid]
+
+        # Cancel the queued simpoints of the group, if it has converged
+        cancelled = []
+        if tracker and not cause and not shutdown:
+            group, weight = simpoint_group(s)
+            value = (stats_cpi(os.path.join(job_folder(s), "stats.txt"))
+                if group is not None else None)
+            if value is not None and tracker.add(group, weight, value):
+                cancelled = sp_queue.cancel(
+                    lambda j: simpoint_group(j)[0] == group)
+                for j in cancelled:
+                    progress.cancel(j.log_path)
+                tracker.write(group, len(cancelled))
+
+        # Remove the process from the running list
+        progress.finish(logpath, end_time - start_time, not cause)
+        if action:
+            progress.queue(logpath, benches)
+        if metrics:
+            job_benches.pop(pid, None)
+            metrics.inc("bench5_jobs_completed_total", 1, {"mode": mode})
+            if cause:
+                metrics.inc("bench5_jobs_failed_total", 1,
+                    {"mode": mode, "cause": cause})
+            if action:
+                metrics.inc("bench5_jobs_retried_total", 1, {"mode": mode})
+        with lock_pids:
+            sp_pids.remove(pid)
+            sp_deadline.pop(pid, None)
+            count_term += 1
+            count_skip += len(cancelled)
+            show_progress()
+
+        # Release the semaphore (makes space for other processes) before
+        # the cleanup, unless lowering the concurrency by withholding the
+        # slot, if requested
+        if not (action == "slot" and sp_queue.holdSlot(args.max_proc)):
+            sem.release()
+
+        # Add the job to the run manifest
+        manifest.addJob({
+            "cmd"    : cmd_join(cmd).strip(),
+            "cwd"    : work_path,
+            "log"    : logpath,
+            "bench"  : list(benches),
+            "queued" : queue_time,
+            "start"  : start_time,
+            "end"    : end_time,
+            "wall"   : end_time - start_time,
+            "utime"  : rusage.ru_utime,
+            "stime"  : rusage.ru_stime,
+            "maxrss" : rusage.ru_maxrss * 1024,
+            "status" : status,
+            "cpu"    : slot[0] if slot else None,
+            "node"   : slot[1] if slot else None,
+            "fail"   : cause,
+            "retry"  : action is not None
+        })
 
         # Directories cleanup / renaming
         work_dir = os.path.basename(work_path)
         out_path = (work_path if work_dir != "tmp" else uppath(work_path, 1))
         if not args.keep_tmp and shutdown:
             # It is useless to keep the output folder in case of brutal exit
-            shutil.rmtree(out_path)
-        else:
+            deleter.submit(out_path)
+        elif not action:
             # Delete the temporary directory
             if work_dir == "tmp" and not args.keep_tmp:
-                shutil.rmtree(work_path)
-            if pid in sp_fail:
+                deleter.submit(work_path)
+            if cause:
                 # Rename directory indicating the cause of failure
                 head, tail = os.path.split(out_path)
-                dest_path = os.path.join(head,
-                    "err_" + sp_fail[pid] + "_" + tail)
+                dest_path = os.path.join(head, "err_" + cause + "_" + tail)
                 if os.path.exists(dest_path):
-                    shutil.rmtree(dest_path)
+                    deleter.submit(dest_path)
                 os.rename(out_path, dest_path)
-
-        # Remove the process from the running list
-        with lock_pids:
-            sp_pids.remove(pid)
-            count_term += 1
-            progress_bar(len(spawn_list), count_term, "[bench5]")
-
-        # Release the semaphore (makes space for other processes)
-        sem.release()
+                out_path = dest_path
+            # Compress the output artifacts in background
+            if postproc:
+                postproc.submit(out_path)
+        # The folders of the cancelled jobs are not needed anymore
+        for j in cancelled:
+            deleter.submit(job_folder(j))
         return
 
     # The spawning procedure runs on a separate thread to avoid blocking
     # the main one (e.g. when the semaphore is waiting to be released)
     def spawn_in_thread():
         thread_list = []
-        for s in spawn_list:
+        while True:
             # Acquire the semaphore (limits the number of active processes)
             sem.acquire()
+            if shutdown:
+                sem.release()
+                break
+            s = next_job()
+            if s is None:
+                sem.release()
+                # Failed processes may still be re-queued by running threads
+                if (not any(t.is_alive() for t in thread_list) and
+                    not sp_queue):
+                    break
+                time.sleep(spawn_interval)
+                continue
             thread = threading.Thread(target=run_in_thread, args=(s,))
             thread_list.append(thread)
             thread.start()
             # Rate limiting
-            time.sleep(1)
+            time.sleep(spawn_interval)
         # Wait for all threads to terminate
         for t in thread_list:
             t.join()
+        # Give back the withheld slots
+        for i in range(sp_queue.held()):
+            sem.release()
         return
 
     # Main thread
@@ -434,23 +772,62 @@ def execute(spawn_list, args, sem, limit_time=False):
     log("executing %d %s (%d at a time), please wait" % (
         len(spawn_list), "instance" if instances == 1 else "instances",
         min(args.max_proc, instances)))
+    # All the jobs are queued from now on
+    manifest.newOp(mode, args.max_proc)
+    queue_time = time.time()
+    # Start sampling the resources used by the children
+    sampler = ResourceSampler(args.sample_int[0], args.sample_int[1])
+    sampler.start()
     # Create and start the spawn thread
     spawn_thread = threading.Thread(target=spawn_in_thread)
     spawn_thread.start()
-    progress_bar(instances, 0, "[bench5]")
+    show_progress()
 
     try:
-        # Periodically check resources utilization
+        # Periodically check resources utilization (and update the estimated
+        # time, which also changes while the processes are running)
+        ticks = 0
         while(spawn_thread.is_alive()):
             if (not args.no_wd):
-                watchdog(limit_time)
+                watchdog()
             time.sleep(1)
+            ticks += 1
+            if ticks % progress_interval == 0:
+                with lock_pids:
+                    if (count_term + count_skip <
+                        len(spawn_list) + count_retry):
+                        show_progress()
+            if metrics and ticks % metrics_interval == 0:
+                export_metrics()
+            if smp_monitor and ticks % sampling_interval == 0:
+                # Stop the simulations whose estimate is accurate enough
+                # (gem5 exits normally on SIGINT, dumping the statistics)
+                for pid in smp_monitor.poll():
+                    if (pid not in sp_fail and
+                        os.path.isdir(os.path.join("/proc", str(pid)))):
+                        os.kill(pid, signal.SIGINT)
     except KeyboardInterrupt:
         # "Graceful" shutdown
         shutdown = True
         for pid in sp_pids:
             os.kill(pid, 9)
+        # Wait for the running threads to discard their folders
+        spawn_thread.join()
+        deleter.join()
         exit(4)
+    sampler.stop()
+    sampler = None
+    manifest.endOp()
+    if metrics:
+        export_metrics()
+    for e in deleter.join():
+        log("warning: deletion failed: %s" % e)
+    if tracecache:
+        tracecache.clear()
+    if postproc:
+        log("waiting for the compression of the output files")
+        for e in postproc.join():
+            log("warning: compression failed: %s" % e)
     return
 
 
@@ -482,6 +859,9 @@ def get_sim_info(mode):
     elif mode == "trc_sim":
         sim_class = TraceReplay
         sim_desc  = "elastic trace replay"
+    elif mode == "smp_sim":
+        sim_class = SampledSimulation
+        sim_desc  = "periodic sampling benchmark simulation"
     else:
         raise Exception("Unknown specified mode")
     return (sim_class, sim_desc)
@@ -493,30 +873,24 @@ def detailed_list(sim, mode, args):
     global warnings
     spawn_list = []
 
-    if mode == "cpt_sim":
-        try:
-            paths = sim.prepareEnvironment(benchsuite, args)
-        except AssertionError as e:
-            if str(e) not in warnings:
-                warnings.append(str(e))
-            return []
+    try:
+        paths = sim.prepareEnvironment(benchsuite, args)
+    except AssertionError as e:
+        if str(e) not in warnings:
+            warnings.append(str(e))
+        return []
+    if sim.isMulti():
         cmd_list = sim.generateCommand(args)
         assert len(cmd_list) == len(paths), "arrays length mismatch"
         for i in range(len(paths)):
             tmp_dir, log_filepath = paths[i]
-            split_cmd = shlex.split(cmd_list[i])
-            spawn_list.append((split_cmd, "", tmp_dir,
-                log_filepath))
+            spawn_list.append(Job(cmd_list[i], "", tmp_dir,
+                log_filepath, sim.getBenchmarks()))
     else:
-        try:
-            tmp_dir, log_filepath = sim.prepareEnvironment(benchsuite, args)
-        except AssertionError as e:
-            if str(e) not in warnings:
-                warnings.append(str(e))
-            return []
+        tmp_dir, log_filepath = paths
         cmd = sim.generateCommand(args)
-        split_cmd = shlex.split(cmd)
-        spawn_list.append((split_cmd, "", tmp_dir, log_filepath))
+        spawn_list.append(Job(cmd, "", tmp_dir, log_filepath,
+            sim.getBenchmarks()))
     return spawn_list
 
 
@@ -525,9 +899,6 @@ def detailed_sim(sim_class, exe, mode, args):
     global warnings
     spawn_list = []
 
-    if args.mp and mode == "cpt_sim":
-        raise Exception("Multiprocessing not supported with checkpoints")
-
     # Select CPU architecture and corresponding parameters
     cpu = []
     for model in simparams.cpu_models[args.arch]:
@@ -543,6 +914,19 @@ def detailed_sim(sim_class, exe, mode, args):
     else:
         instances = [(model, "", "") for model in cpu]
 
+    # Multi-programmed mixes, one simulation each
+    if args.mix:
+        mixes = get_mixes(args)
+        for model, tech, case in instances:
+            for mix in mixes:
+                sim = sim_class(args)
+                sim.setSimPath(exe)
+                sim.setDetailedParams(model, tech, case, args)
+                for b_name, b_params, subset in mix:
+                    sim.addWorkload(b_name, b_params, subset, args)
+                spawn_list.extend(detailed_list(sim, mode, args))
+        return spawn_list
+
     for i in instances:
         model = i[0]
         tech  = i[1]
@@ -595,14 +979,56 @@ def detailed_sim(sim_class, exe, mode, args):
     return spawn_list
 
 
+# Generate the multi-programmed mixes of the selected benchmarks
+# List of mixes, each one a tuple of (name, parameters, subset)
+def get_mixes(args):
+    global warnings
+    candidates, b_params = [], {}
+    for b_name in args.benchmarks:
+        try:
+            b_params[b_name] = get_params(args, b_name)
+        except AssertionError as e:
+            if str(e) not in warnings:
+                warnings.append(str(e))
+            # Skip this benchmark if resources are not found
+            continue
+        ss_params = get_ss_params(b_name, args.set[0])
+        if not args.mix_subsets or args.sss:
+            # Take first subset only
+            ss_params = ss_params[:1]
+        candidates.append((b_name, ss_params))
+    mixes, total = generate_mixes(candidates, args.mix, args.mix_sample,
+        args.mix_seed)
+    log("%d mixes of %d benchmarks%s" % (len(mixes), args.mix,
+        " (sampled from %d)" % total if len(mixes) < total else ""))
+    return [tuple((b, b_params[b], ss) for b, ss in mix) for mix in mixes]
+
+
+# Command of the simpoint utility, saving the simpoints of a subset and
+# their weights in out_dir (with the given projection dimension and seed, if
+# any, otherwise the defaults of SimPoint)
+def simpoint_cmd(exe, bbv_filepath, out_dir, subset, maxk, args, dim=None,
+                 seed=None):
+    argv = ([exe] + (["-inputVectorsGzipped"] if args.use_gem5 else []) +
+        ["-loadFVFile", bbv_filepath, "-maxK", str(maxk)])
+    if dim is not None:
+        argv += ["-dim", str(dim)]
+    if seed is not None:
+        argv += ["-seedkmeans", str(seed), "-seedproj", str(seed)]
+    argv += ["-saveSimpoints", os.path.join(out_dir, "simpoint_%s" % subset),
+        "-saveSimpointWeights", os.path.join(out_dir, "weight_%s" % subset)]
+    return raw_command(argv)
+
+
 # Simple or dummy simulation
 def simple_sim(sim_class, exe, mode, args):
     global benchsuite
     global warnings
     spawn_list = []
+    cached = 0
 
-    if args.mp:
-        log("note: parameter --mp is ignored in this mode")
+    if args.mp or args.mix:
+        log("note: parameters --mp and --mix are ignored in this mode")
     if mode == "trc_gen":
         if not args.trace_nohint:
             log("note: using hint from simpoint for fast-forwarding")
@@ -633,12 +1059,22 @@ def simple_sim(sim_class, exe, mode, args):
             sim = sim_class(args)
             sim.addWorkload(b_name, b_params, subset, args)
             try:
-                tmp_dir, log_filepath = sim.prepareEnvironment(
-                    benchsuite, args)
+                paths = sim.prepareEnvironment(benchsuite, args)
             except AssertionError as e:
                 if str(e) not in warnings:
                     warnings.append(str(e))
                 continue
+            if mode == "sp_gen" and sim.isMulti():
+                # A run for each point of the grid not computed yet
+                for tmp_dir, log_filepath, point in paths:
+                    key, maxk, dim, seed = point
+                    spawn_list.append(Job(simpoint_cmd(exe,
+                        sim.getBBVFilePath(), uppath(tmp_dir, 1), subset[0],
+                        maxk, args, dim, seed), "", tmp_dir, log_filepath,
+                        (b_name,)))
+                cached += sim.cached()
+                continue
+            tmp_dir, log_filepath = paths
             if mode == "bbv_gen" and not args.use_gem5:
                 out_dir = sim.getOutPath()
                 bbv_filepath = os.path.join(out_dir, "bb.out.%s.%s" % (
@@ -646,25 +1082,18 @@ def simple_sim(sim_class, exe, mode, args):
                 pc_filepath = os.path.join(out_dir, "pc.%s.%s" % (
                     b_abbr, subset[0]))
                 # Execute valgrind with exp-bbv tool
-                cmd = ("valgrind --tool=exp-bbv" +
-                    " --interval-size=" + str(args.int_size) +
-                    " --bb-out-file=" + bbv_filepath +
-                    " --pc-out-file=" + pc_filepath +
-                    " ./" + b_params[0] + " " + subset[1])
+                cmd = raw_command(["valgrind", "--tool=exp-bbv",
+                    "--interval-size=%d" % (args.bbv_base or args.int_size),
+                    "--bb-out-file=" + bbv_filepath,
+                    "--pc-out-file=" + pc_filepath,
+                    "./" + b_params[0]] + shlex.split(subset[1]))
                 in_name = subset[2]
             elif mode == "sp_gen":
                 out_dir = sim.getOutPath()
-                bbv_filepath = sim.getBBVFilePath()
-                sp_filepath  = os.path.join(out_dir, "simpoint_%s" % subset[0])
-                wgt_filepath = os.path.join(out_dir, "weight_%s" % subset[0])
                 log_filepath = os.path.join(out_dir, "log_%s" % subset[0])
                 # Execute the simpoint utility
-                cmd = (exe +
-                   (" -inputVectorsGzipped" if args.use_gem5 else "") +
-                    " -loadFVFile " + bbv_filepath +
-                    " -maxK " + str(args.maxk) +
-                    " -saveSimpoints " + sp_filepath +
-                    " -saveSimpointWeights " + wgt_filepath)
+                cmd = simpoint_cmd(exe, sim.getBBVFilePath(), out_dir,
+                    subset[0], args.maxk, args)
                 in_name = ""
             elif mode == "profile":
                 out_dir = sim.getOutPath()
@@ -673,20 +1102,103 @@ def simple_sim(sim_class, exe, mode, args):
                 log_filepath = os.path.join(out_dir, "%s.%s.log" % (
                     b_abbr, subset[0]))
                 # Execute valgrind with massif tool
-                cmd = ("valgrind --tool=massif" +
-                    " --pages-as-heap=yes" +
-                    " --massif-out-file=" + mem_filepath +
-                    " ./" + b_params[0] + " " + subset[1])
+                cmd = raw_command(["valgrind", "--tool=massif",
+                    "--pages-as-heap=yes",
+                    "--massif-out-file=" + mem_filepath,
+                    "./" + b_params[0]] + shlex.split(subset[1]))
                 in_name = subset[2]
             else:
                 sim.setSimPath(exe)
                 cmd = sim.generateCommand(args)
                 in_name = ""
-            split_cmd = shlex.split(cmd)
-            spawn_list.append((split_cmd, in_name, tmp_dir, log_filepath))
+            spawn_list.append(Job(cmd, in_name, tmp_dir, log_filepath,
+                (b_name,)))
+    if cached:
+        log("note: %d simpoint %s already computed, skipped" % (cached,
+            "run" if cached == 1 else "runs"))
     return spawn_list
 
 
+# Output folder of a job (the parent of its temporary folder, if any)
+def job_folder(job):
+    return (uppath(job.work_path, 1) if os.path.basename(job.work_path) ==
+        "tmp" else job.work_path)
+
+
+# Group of a job run from a weighted simpoint (the folder containing the
+# simpoint folders of a benchmark and configuration) and its weight
+# Tuple: (group, weight), or (None, None) if not run from a simpoint
+def simpoint_group(job):
+    folder = job_folder(job)
+    weight = folder_weight(os.path.basename(folder))
+    if weight is None:
+        return None, None
+    return os.path.dirname(folder), weight
+
+
+# Order the jobs run from weighted simpoints by descending weight within each
+# group, interleaving the groups, so that the heaviest simpoints of every
+# group run first (the other jobs are kept at the end)
+def converge_order(spawn_list):
+    groups, order, others = {}, [], []
+    for s in spawn_list:
+        group, weight = simpoint_group(s)
+        if group is None:
+            others.append(s)
+            continue
+        if group not in groups:
+            groups[group] = []
+            order.append(group)
+        groups[group].append((weight, s))
+    ranked = [sorted(groups[g], key=lambda x: -x[0]) for g in order]
+    ordered = []
+    for i in range(max(len(r) for r in ranked) if ranked else 0):
+        ordered += [r[i][1] for r in ranked if i < len(r)]
+    return ordered + others
+
+
+# Combine the results of the jobs run from several weighted simpoints (the
+# job folders start with the prefix of the mode, see weighted_prefixes)
+def combine_simpoints(spawn_list, mode):
+    sp_prefix = weighted_prefixes.get(mode)
+    if not sp_prefix:
+        return
+    folders = [job_folder(j) for j in spawn_list]
+    for d in sorted(set(os.path.dirname(f) for f in folders
+            if os.path.basename(f).startswith(sp_prefix))):
+        if weighted_stats(d, sp_prefix):
+            log("weighted statistics saved in %s" % d)
+
+
+# Copy the executables and input data of the given benchmarks to the
+# node-local stage folder
+def stage_benchmarks(benchmarks, args):
+    stage = Stage(args.spec_dir, args.stage_dir)
+    stage.acquire()
+    folders = []
+    for b_name in sorted(benchmarks):
+        exe_folder, in_folders = bench_folders(args.spec_dir,
+            args.benchsuite, b_name, args.set[0])
+        folders += [exe_folder] + in_folders
+    log("staging the benchmarks in %s, please wait" % args.stage_dir)
+    files, size = stage.sync(folders)
+    log("%d files copied (%dMB)" % (files, size // 2**20))
+    return stage
+
+
+# Expected resources of each job, for the execution plan
+# List of tuples: (median wall time of the previous runs, simulated memory)
+def expected_resources(spawn_list, mode, args):
+    history = load_history(args.out_dir)
+    resources = []
+    for s in spawn_list:
+        walls = history.get((mode, "+".join(s.benches)))
+        mem_size = s.cmd.getParam("mem-size")
+        resources.append((percentile(walls, 50) if walls else None,
+            sizenum(mem_size) if mem_size else None))
+    return resources
+
+
 def simulate(mode, args, sem):
     global warnings
     sim_class, sim_desc = get_sim_info(mode)
@@ -714,11 +1226,20 @@ def simulate(mode, args, sem):
     if spawn_list:
         if args.dry:
             for s in spawn_list:
-                print(">\t%s" % cmd_join(s[0]))
+                print(">\t%s" % cmd_join(s.argv()))
         elif args.sge:
             gen_sge_job(spawn_list, args)
+        elif args.plan:
+            exec_plan.addOp(mode, spawn_list,
+                expected_resources(spawn_list, mode, args))
+            exec_plan.write(args.plan)
+            log("%d jobs added to plan %s" % (len(spawn_list), args.plan))
         else:
-            execute(spawn_list, args, sem, mode == "cpt_sim")
+            execute(spawn_list, args, sem, mode)
+            # Save the accounting of the executed jobs
+            manifest.write(os.path.join(args.out_dir,
+                "manifest_%s.json" % short_uuid))
+            combine_simpoints(spawn_list, mode)
             summary = True
     else:
         log("nothing to execute")
@@ -726,14 +1247,212 @@ def simulate(mode, args, sem):
     return summary
 
 
-# Main function
-def main():
-    global benchlist
-    global benchsuite
+# Add the arguments which control the execution of the processes
+def add_exec_args(parser):
+    parser.add_argument("--max-proc", action="store", type=int, metavar="N",
+        default=int(os.sysconf('SC_NPROCESSORS_ONLN')),
+        help="number of processes that can run concurrently " +
+        "(default: %(default)s)")
+    parser.add_argument("--pin", action="store_true",
+        help="run each process on a dedicated core, with memory bound to " +
+        "its NUMA node")
+    parser.add_argument("--no-smt", action="store_true",
+        help="with --pin, use a single hardware thread per physical core")
+    parser.add_argument("--compress", action="store", type=str,
+        choices=["gzip", "zstd"], help="compress the output files of each " +
+        "process in background")
+    parser.add_argument("--compress-files", action="store", type=str,
+        metavar="PATTERNS", default="stats.txt,config.ini,config.json,*.proto",
+        help="comma-separated file name patterns to compress " +
+        "(default: %(default)s)")
+    parser.add_argument("--compress-jobs", action="store", type=int,
+        metavar="N", default=2, help="number of compression workers " +
+        "(default: %(default)s)")
+    parser.add_argument("--compress-threads", action="store", type=int,
+        metavar="N", default=4, help="threads used by each compression " +
+        "worker, if supported (default: %(default)s)")
+    parser.add_argument("--trace-cache", action="store", type=str,
+        metavar="SIZE", help="decompress each trace only once in a local " +
+        "cache of the given size for trace replay")
+    parser.add_argument("--cache-dir", action="store", type=path,
+        metavar="DIR", help="path of the trace cache folder (default: " +
+        "/dev/shm if available, otherwise the output folder)")
+    parser.add_argument("--keep-tmp", action="store_true",
+        help="do not remove temporary folders after the execution")
+    parser.add_argument("--no-wd", action="store_true",
+        help="disable watchdog")
+    parser.add_argument("--timeout", action="append", type=timeout,
+        metavar="[KEY=]TIME", default=[], help="kill processes running " +
+        "longer than TIME (e.g. 90m, 6h), optionally only for a mode or " +
+        "a benchmark KEY (default: cpt_sim=6h)")
+    parser.add_argument("--retry", action="store", type=int, metavar="N",
+        default=0, help="re-queue processes failed due to memory issues up " +
+        "to N times, increasing resources (default: %(default)s)")
+    parser.add_argument("--auto-timeout", action="store", type=float,
+        metavar="F", help="derive time limits from previous runs in the " +
+        "output folder (99th percentile of the wall time multiplied by F)")
+    parser.add_argument("--sample-int", action="store", type=float, nargs=2,
+        metavar=("MIN", "MAX"), default=[1., 30.], help="adaptive resource " +
+        "sampling interval bounds in seconds (default: 1 30)")
+    parser.add_argument("--log-cap", action="store", type=str,
+        metavar="SIZE", help="capture the output of the processes through " +
+        "a pipe and write it gzip-compressed, up to SIZE (then only the " +
+        "tail is kept), without syncing it (default: plain log files)")
+    parser.add_argument("--log-tail", action="store", type=str,
+        metavar="SIZE", default="4MB", help="with --log-cap, amount of " +
+        "output kept at the end of the log and used to classify the " +
+        "failures (default: %(default)s)")
+    parser.add_argument("--metrics", action="store", type=path,
+        metavar="FILE", help="periodically write the metrics of the " +
+        "campaign to FILE, in Prometheus text format")
+    parser.add_argument("--metrics-port", action="store", type=int,
+        metavar="PORT", help="serve the metrics of the campaign on " +
+        "http://127.0.0.1:PORT")
+    parser.add_argument("--no-res-log", action="store_true",
+        help="do not record the resource usage time series of each process")
+    parser.add_argument("--cpt-error", action="store", type=float,
+        metavar="F", help="with -x or -r, run the heaviest simpoints of " +
+        "each benchmark and configuration first, and cancel the remaining " +
+        "ones once the weighted CPI is known within F, a heuristic bound " +
+        "assuming that the CPI of the remaining simpoints is in the range " +
+        "of the ones simulated so far")
+    parser.add_argument("--cpt-min", action="store", type=int, metavar="N",
+        default=3, help="with --cpt-error, minimum number of simpoints " +
+        "simulated before cancelling (default: %(default)s)")
+    parser.add_argument("--cpt-weight", action="store", type=float,
+        metavar="F", default=0.5, help="with --cpt-error, minimum fraction " +
+        "of the total weight simulated before cancelling, as a few " +
+        "similar results make the bound narrow (default: %(default)s)")
+    parser.add_argument("--smp-error", action="store", type=float,
+        metavar="F", default=0.03, help="with periodic sampling, stop the " +
+        "simulation when the confidence interval of the CPI is within F " +
+        "of the mean (default: %(default)s, 0 = never)")
+    parser.add_argument("--smp-conf", action="store", type=float,
+        choices=[0.9, 0.95, 0.99], default=0.95, help="confidence level " +
+        "of the interval (default: %(default)s)")
+    parser.add_argument("--smp-min", action="store", type=int, metavar="N",
+        default=30, help="minimum number of sampling windows before " +
+        "stopping (default: %(default)s)")
+    return
+
+
+# Check if time limits refer to valid modes or benchmarks
+def check_timeouts(parser, args, modes, benchmarks):
+    for key, value in args.timeout:
+        if (key and key not in modes and
+            not any(key == b or key == b.split('.')[0] for b in benchmarks)):
+            parser.error("invalid timeout key %s" % key)
+
+
+# Print the results of an operation and reset the counters
+def report_op(ret):
     global count_pids
     global count_term
-    global sp_fail
+    global count_retry
+    global count_skip
+
+    # Print failed processes and clear the list
+    count_fail = len(sp_fail)
+    for pid in sp_fail:
+        log("pid " + str(pid) + " failed (code: " + sp_fail[pid] + ")")
+    sp_fail.clear()
+
+    if ret:
+        # Print some statistics
+        log("operation complete")
+        log("|___ number of spawned processes\t= %d" % count_pids)
+        log("|___ number of retried processes\t= %d" % count_retry)
+        if count_skip:
+            log("|___ number of cancelled processes\t= %d" % count_skip)
+        log("|___ number of failed processes\t= %d" % count_fail)
+        if count_pids != 0:
+            log("|___ success rate\t\t\t= %d%%" % (
+                (1 - float(count_fail) / count_pids) * 100))
+        for l in op_summary(manifest.lastOp()):
+            log(l)
+    # Reset the counters for next phase
+    count_pids = 0
+    count_term = 0
+    count_retry = 0
+    count_skip = 0
+    return
 
+
+# Execute a shard of a plan generated with --plan, or merge the results
+def execute_plan(argv):
+    global manifest
+
+    parser = argparse.ArgumentParser(prog="bench5.py execute-plan",
+        description="Execute a plan generated with --plan, possibly split " +
+        "among several hosts")
+    parser.add_argument("plan", type=path, help="plan file")
+    parser.add_argument("--shard", action="store", type=str, metavar="I/N",
+        default="1/1", help="execute the I-th of N load-balanced subsets " +
+        "of the jobs of each operation (default: %(default)s)")
+    parser.add_argument("--merge", action="store_true",
+        help="merge the results of the executed shards instead")
+    add_exec_args(parser)
+    args = parser.parse_args(argv)
+    try:
+        index, count = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+    log("welcome to bench5!")
+    plan = ExecutionPlan.load(args.plan)
+    # Use the same settings of the plan
+    args.set = [plan.getInfo("set")]
+    args.benchsuite = plan.getInfo("suite")
+    args.arch = plan.getInfo("arch")
+    args.out_dir = plan.getInfo("out_dir")
+    args.spec_dir = plan.getInfo("spec_dir")
+    args.stage_dir = plan.getInfo("stage_dir")
+    ops = plan.getOps()
+    check_timeouts(parser, args, [op[0] for op in ops],
+        set(b for op in ops for j in op[1] for b in j.benches))
+
+    if args.merge:
+        merged, missing = merge_results(plan, args.out_dir)
+        log("merged the results of %d shards" % merged)
+        for l in missing:
+            log("warning: no results for %s" % l)
+        for mode, jobs, resources in ops:
+            combine_simpoints(jobs, mode)
+        log("all done, quitting")
+        return
+
+    manifest = RunManifest("%s_%dof%d" % (plan.getInfo("id"), index + 1,
+        count), args)
+    sem = threading.Semaphore(args.max_proc)
+    shard = plan.shard(index, count)
+    # The job folders link to the local copy of the benchmarks, if any
+    stage = None
+    if args.stage_dir:
+        stage = stage_benchmarks(set(b for mode, jobs in shard
+            for j in jobs for b in j.benches), args)
+    for mode, jobs in shard:
+        log("-> %s (shard %d/%d) <-" % (mode, index + 1, count))
+        if jobs:
+            execute(jobs, args, sem, mode)
+            # Save the accounting of the executed jobs
+            manifest.write(shard_manifest(args.out_dir, plan.getInfo("id"),
+                index, count))
+            if count == 1:
+                combine_simpoints(jobs, mode)
+        else:
+            log("nothing to execute")
+        report_op(bool(jobs))
+        print("")
+    if stage:
+        stage.release()
+    if metrics:
+        metrics.stop()
+    log("all done, quitting")
+    return
+
+
+# Create the command-line parser
+def build_parser():
     # Default benchmark suite
     def_bs = "spec2017"
     def_yr = ''.join(c for c in def_bs if c.isdigit())
@@ -761,16 +1480,36 @@ def main():
         help="simulate target benchmarks normally")
     parser.add_argument("-p", "--profile", action="store_true",
         help="profile benchmarks memory utilization")
+    parser.add_argument("-w", "--sampled", action="store_true",
+        help="simulate target benchmarks with periodic sampling")
     parser.add_argument("--benchsuite", action="store", type=str,
-        default=def_bs, choices=["spec2006","spec2017"],
+        default=def_bs, choices=benchsuites.available(),
         help="benchmark suite (default: %(default)s)")
     parser.add_argument("--arch", action="store", type=str, default="aarch64",
         choices=["aarch64","armhf","x86-64"], help="cpu architecture " +
         "(default: %(default)s)")
     parser.add_argument("--maxk", action="store", type=int, metavar="N",
         default=30, help="maxK parameter for simpoint (default: %(default)s)")
+    parser.add_argument("--sp-maxk", action="store", type=int_list,
+        metavar="LIST", help="with -s, run simpoint for each maxK in LIST " +
+        "(combined with --sp-dim and --sp-seed), saving the results of " +
+        "each combination in a subfolder named after its parameters " +
+        "(e.g. k30_d15_s1), reused if already computed")
+    parser.add_argument("--sp-dim", action="store", type=int_list,
+        metavar="LIST", help="with -s, projection dimensions of the " +
+        "simpoint grid (default: %d)" % default_dim)
+    parser.add_argument("--sp-seed", action="store", type=int_list,
+        metavar="LIST", help="with -s, random seeds of the simpoint grid " +
+        "(default: %d)" % default_seed)
+    parser.add_argument("--sp-key", action="store", type=str, metavar="KEY",
+        help="use the simpoints of the grid run KEY (e.g. k30_d15_s1) for " +
+        "checkpoint and trace generation")
     parser.add_argument("--int-size", action="store", type=int, metavar="N",
         default=100000000, help="bbv interval size (default: %(default)s)")
+    parser.add_argument("--bbv-base", action="store", type=int, metavar="N",
+        help="with -b, profile at interval size N (in an int_N subfolder); " +
+        "with -s, derive the BBVs of --int-size (a multiple of N) from " +
+        "that profile")
     parser.add_argument("--warmup", action="store", type=int, metavar="N",
         default=0, help="number of warmup instructions (default: %(default)s)")
     parser.add_argument("--trace-nohint", action="store_true",
@@ -781,12 +1520,30 @@ def main():
     parser.add_argument("--trace-insts", action="store", type=int, metavar="N",
         default=1000000000, help="instruction limit for trace generation" +
         " (default: %(default)s)")
+    parser.add_argument("--trace-sps", action="store", type=int, metavar="N",
+        default=1, help="generate traces for the N most relevant simpoints" +
+        " (default: %(default)s)")
+    parser.add_argument("--trace-cov", action="store", type=float,
+        metavar="F", help="generate traces for the most relevant simpoints " +
+        "until their total weight reaches F (overrides --trace-sps)")
     parser.add_argument("--trace-prefix", action="store", type=str,
         metavar="STR", default="system.switch_cpus.traceListener",
         help="trace name prefix (default: %(default)s)")
     parser.add_argument("--trace-cfg", action="store", type=str,
         metavar="STR", default="etrace_replay.py",
         help="gem5 config file for trace replay (default: %(default)s)")
+    parser.add_argument("--smp-period", action="store", type=int,
+        metavar="N", default=10000000, help="instructions between the " +
+        "starts of two sampling windows (default: %(default)s)")
+    parser.add_argument("--smp-window", action="store", type=int,
+        metavar="N", default=10000, help="instructions measured in each " +
+        "sampling window (default: %(default)s)")
+    parser.add_argument("--smp-warmup", action="store", type=int,
+        metavar="N", default=20000, help="detailed warmup instructions " +
+        "before each sampling window (default: %(default)s)")
+    parser.add_argument("--smp-cfg", action="store", type=str,
+        metavar="STR", default="smarts.py",
+        help="gem5 config file for periodic sampling (default: %(default)s)")
     parser.add_argument("--l2-banks", action="store", type=int, metavar="N",
         default=4, help="number of banks in L2 cache (default: %(default)s)")
     parser.add_argument("--l3-banks", action="store", type=int, metavar="N",
@@ -803,10 +1560,6 @@ def main():
     parser.add_argument("--l3-hwp", action="store", type=str, default=None,
         choices=list(simparams.hwp_config), help="L3 prefetcher parameters" +
         " (default: %(default)s)")
-    parser.add_argument("--max-proc", action="store", type=int, metavar="N",
-        default=int(os.sysconf('SC_NPROCESSORS_ONLN')),
-        help="number of processes that can run concurrently " +
-        "(default: %(default)s)")
     parser.add_argument("--sp-dir", action="store", type=path, metavar="DIR",
         default=os.path.join(home, "simpoint"), help="path of the simpoint " +
         "utility folder (default: %(default)s)")
@@ -835,17 +1588,60 @@ def main():
         help="use a single subset for each benchmark (the first one)")
     parser.add_argument("--mp", action="store_true",
         help="multiprocess environment (one benchmark per core)")
-    parser.add_argument("--keep-tmp", action="store_true",
-        help="do not remove temporary folders after the execution")
+    parser.add_argument("--mix", action="store", type=int, metavar="K",
+        help="simulate all the multi-programmed mixes of K different " +
+        "benchmarks among the selected ones (one benchmark per core)")
+    parser.add_argument("--mix-sample", action="store", type=int,
+        metavar="N", help="with --mix, simulate N mixes sampled uniformly")
+    parser.add_argument("--mix-seed", action="store", type=int, metavar="S",
+        default=0, help="random seed of --mix-sample (default: %(default)s)")
+    parser.add_argument("--mix-subsets", action="store_true",
+        help="with --mix, combine all the subsets of the benchmarks " +
+        "instead of the first one")
+    parser.add_argument("--mp-pairing", action="store", type=str,
+        choices=["rank","cross"], default="rank", help="with --mp or " +
+        "--mix and -x, restore the simpoints of the benchmarks paired by " +
+        "rank of weight (cycling over the ones with fewer simpoints), or in " +
+        "all the combinations (default: %(default)s)")
+    parser.add_argument("--mp-insts", action="store", type=int,
+        metavar="N", help="with --mp or --mix and -x, end each simulation " +
+        "when a core reaches N instructions (default: interval size plus " +
+        "warmup)")
     parser.add_argument("--use-gem5", action="store_true",
         help="use gem5 for bbv generation and gz format for simpoint")
     parser.add_argument("--debug", action="store_true",
         help="use gem5.opt instead of gem5.fast")
-    parser.add_argument("--no-wd", action="store_true",
-        help="disable watchdog")
     parser.add_argument("--sge", action="store_true",
         help="generate sge job scripts instead of executing")
+    parser.add_argument("--plan", action="store", type=path, metavar="FILE",
+        help="write the execution plan to FILE instead of executing " +
+        "(see execute-plan)")
+    parser.add_argument("--stage-dir", action="store", type=path,
+        metavar="DIR", help="copy the executables and input data of the " +
+        "benchmarks once to a node-local folder in DIR, shared by the " +
+        "runs on the host and removed when the last one ends, and link " +
+        "the job folders to it (with --plan, DIR must be available on " +
+        "every host)")
+    add_exec_args(parser)
+    return parser
+
+
+# Main function
+def main():
+    global benchlist
+    global benchsuite
+    global catalog
+    global manifest
+    global exec_plan
+
+    # Separate entry point for the execution of plans
+    if len(sys.argv) > 1 and sys.argv[1] == "execute-plan":
+        execute_plan(sys.argv[2:])
+        return
+
+    parser = build_parser()
     args = parser.parse_args()
+    home = os.path.expanduser("~")
 
     # Set default paths according to selected benchmark suite
     benchsuite = args.benchsuite
@@ -861,19 +1657,14 @@ def main():
 
     # Import the selected benchmark suite module globally
     try:
-        if benchsuite == "spec2006":
-            __import__("benchsuites.spec2006")
-            benchlist = sys.modules["benchsuites.spec2006"]
-        elif benchsuite == "spec2017":
-            __import__("benchsuites.spec2017")
-            benchlist = sys.modules["benchsuites.spec2017"]
-        else:
-            raise ImportError("invalid benchmark suite: %s" % benchsuite)
+        catalog = benchsuites.load(benchsuite)
+        benchlist = catalog.module
     except ImportError as e:
         log("error: %s" % e)
         exit(1)
 
     log("welcome to bench5!")
+    manifest = RunManifest(short_uuid, args)
     notes = False
     if args.mp:
         log("note: parameter --mp implies --sss")
@@ -882,9 +1673,6 @@ def main():
     if notes:
         print("")
 
-    if (len(args.benchmarks) == 1 and
-        args.benchmarks[0] in benchlist.bench_groups):
-        args.benchmarks = list(benchlist.bench_groups[args.benchmarks[0]])
     sem = threading.Semaphore(args.max_proc)
 
     # Create the operation list
@@ -897,6 +1685,7 @@ def main():
     ops.append(("trc_sim",  args.replay))
     ops.append(("full_sim", args.full))
     ops.append(("profile",  args.profile))
+    ops.append(("smp_sim",  args.sampled))
 
     bools = [op[1] for op in ops]
     # Check if any operation has been selected
@@ -908,45 +1697,68 @@ def main():
           (bools[0] and not bools[1] and bools[3])):
         parser.error("simpoint-related operations are not consecutive")
 
-    # Check if specified benchmarks actually exist
-    for i, b_name in enumerate(args.benchmarks):
-        b_found = False
-        for bl_bench in benchlist.benchmarks:
-            if (b_name == bl_bench or
-                b_name == bl_bench.split('.')[0]):
-                args.benchmarks[i] = bl_bench
-                b_found = True
-                break
-        if b_found == False:
-            log("error: unknown benchmark %s" % b_name)
+    # Expand groups and numeric ids, checking that the benchmarks exist
+    benchmarks = []
+    for token in args.benchmarks:
+        try:
+            resolved = catalog.resolve(token)
+        except KeyError as e:
+            log("error: %s" % e.args[0])
             exit(1)
+        benchmarks.extend(b for b in resolved if b not in benchmarks)
+    args.benchmarks = benchmarks
+
+    check_timeouts(parser, args, [op[0] for op in ops],
+        catalog.benchmarks())
+    if args.mix is not None:
+        if args.mp:
+            parser.error("--mix cannot be used with --mp")
+        if not 2 <= args.mix <= len(args.benchmarks):
+            parser.error("--mix must be between 2 and the number of " +
+                "benchmarks")
+    sp_grid = bool(args.sp_maxk or args.sp_dim or args.sp_seed)
+    if sp_grid and args.simpoints and not args.sp_key and (args.checkpoints
+        or (args.trace and not args.trace_nohint)):
+        parser.error("select the simpoints of a grid run with --sp-key")
+    if sp_grid and args.sp_key and args.sp_key not in [p[0] for p in
+        simpoint_grid(args.sp_maxk or [args.maxk], args.sp_dim or
+        [default_dim], args.sp_seed or [default_seed])]:
+        parser.error("--sp-key %s is not a run of the grid" % args.sp_key)
+    if args.bbv_base is not None and (args.bbv_base < 1 or
+        args.int_size % args.bbv_base):
+        parser.error("--int-size must be a multiple of --bbv-base")
+    if args.mix_sample is not None and args.mix_sample < 1:
+        parser.error("--mix-sample must be positive")
+    if args.plan and (args.dry or args.sge):
+        parser.error("--plan cannot be used with --dry or --sge")
+    if args.stage_dir and args.sge:
+        parser.error("--stage-dir cannot be used with --sge")
+    # Node-local copy of the benchmarks, needed to prepare the job folders
+    stage = None
+    if args.stage_dir:
+        # Same folder for all the runs on the host from the same SPEC tree
+        args.stage_dir = os.path.join(args.stage_dir, "bench5_stage_%s" %
+            hashlib.md5(os.path.abspath(args.spec_dir).encode("utf-8"))
+            .hexdigest()[:12])
+        if not args.dry:
+            stage = stage_benchmarks(args.benchmarks, args)
+            print("")
+    if args.plan:
+        exec_plan = ExecutionPlan(short_uuid, args)
 
     for i in range(len(ops)):
         if ops[i][1]:
             ret = simulate(ops[i][0], args, sem)
-
-            # Print failed processes and clear the list
-            count_fail = len(sp_fail)
-            for pid in sp_fail:
-                log("pid " + str(pid) + " failed (code: " + sp_fail[pid] + ")")
-            sp_fail.clear()
-
-            if ret:
-                # Print some statistics
-                log("operation complete")
-                log("|___ number of spawned processes\t= %d" % count_pids)
-                log("|___ number of failed processes\t= %d" % count_fail)
-                if count_pids != 0:
-                    log("|___ success rate\t\t\t= %d%%" % (
-                        (1 - float(count_fail) / count_pids) * 100))
-            # Reset the counters for next phase
-            count_pids = 0
-            count_term = 0
+            report_op(ret)
 
             # Next operation must fetch data from generated output
             args.data_dir = args.out_dir
             # Add a new line
             print("")
+    if stage:
+        stage.release()
+    if metrics:
+        metrics.stop()
     log("all done, quitting")
 
 if __name__ == "__main__":
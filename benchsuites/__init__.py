@@ -1 +1,112 @@
- 
+""" Registry of the benchmark suites. Each suite is a module of this package
+(or of any folder listed in the BENCH5_SUITES environment variable, which is
+searched too) defining at least the benchmarks tuple and the bench_groups,
+exe_name, preprocessing, mem_size, subset, params and input dicts, as in
+spec2017.py. Suites are only imported when used, and indexed once. """
+
+import importlib
+import os
+import pkgutil
+import threading
+
+# Folders with additional suites
+suite_path_env = "BENCH5_SUITES"
+__path__.extend(p for p in os.environ.get(suite_path_env, "").split(
+    os.pathsep) if p and os.path.isdir(p))
+
+# Loaded catalogs, by suite name
+_catalogs = {}
+_lock = threading.Lock()
+
+
+# Names of the available suites (without importing them)
+def available():
+    return sorted(set(m[1] for m in pkgutil.iter_modules(__path__)))
+
+
+""" Index of the benchmarks of a suite: by full name, by numeric id (e.g.
+"505" for 505.mcf_r, if not ambiguous), by group, and the subsets of each
+benchmark in each set. The suite module is available as module. """
+class Catalog(object):
+    def __init__(self, name, module):
+        self.name    = name
+        self.module  = module
+        self._names  = dict((b, i) for i, b in enumerate(module.benchmarks))
+        self._ids    = {}
+        for b in module.benchmarks:
+            self._ids.setdefault(b.split('.')[0], []).append(b)
+        # Groups are materialized, since they may be generators
+        self._groups = {}
+        for group, members in module.bench_groups.items():
+            try:
+                self._groups[group] = tuple(b for m in members
+                    for b in self.resolve(m))
+            except KeyError as e:
+                raise ImportError("invalid group %s of benchmark suite " %
+                    group + "%s: %s" % (name, e.args[0]))
+        # Subsets by set, then by benchmark (built on first use)
+        self._subsets = {}
+        return
+
+    def benchmarks(self):
+        return self.module.benchmarks
+
+    def groups(self):
+        return sorted(self._groups)
+
+    # Resolve a full name, numeric id or group name to benchmark names
+    # Raise a KeyError if unknown or ambiguous
+    def resolve(self, token):
+        if token in self._names:
+            return (token,)
+        if token in self._groups:
+            return self._groups[token]
+        matches = self._ids.get(token, [])
+        if len(matches) > 1:
+            raise KeyError("ambiguous benchmark %s (%s)" % (token,
+                ", ".join(matches)))
+        if not matches:
+            raise KeyError("unknown benchmark %s" % token)
+        return tuple(matches)
+
+    def _indexSet(self, b_set):
+        subset = self.module.subset.get(b_set)
+        params = self.module.params.get(b_set)
+        inputs = self.module.input.get(b_set)
+        if any(v is None for v in (subset, params, inputs)):
+            return None
+        index = {}
+        for b_name in self.module.benchmarks:
+            b_params = params.get(b_name, "")
+            b_input  = inputs.get(b_name, "")
+            if b_name in subset:
+                index[b_name] = tuple((ss + "_" + b_set,
+                    b_params[i] if isinstance(b_params, tuple) else "",
+                    b_input[i]  if isinstance(b_input, tuple) else "")
+                    for i, ss in enumerate(subset[b_name]))
+            else:
+                index[b_name] = ((b_set, b_params, b_input),)
+        return index
+
+    # Subsets of a benchmark in a set, or None if the set does not exist
+    # List of tuples: (subset name, options, input file)
+    def subsets(self, b_name, b_set):
+        if b_set not in self._subsets:
+            self._subsets[b_set] = self._indexSet(b_set)
+        index = self._subsets[b_set]
+        if index is None:
+            return None
+        return list(index.get(b_name, ((b_set, "", ""),)))
+
+
+# Load and index a suite, only once
+# Raise an ImportError if not available, or if a group refers to an unknown
+# benchmark
+def load(name):
+    with _lock:
+        if name not in _catalogs:
+            if name not in available():
+                raise ImportError("invalid benchmark suite: %s" % name)
+            module = importlib.import_module("%s.%s" % (__name__, name))
+            _catalogs[name] = Catalog(name, module)
+        return _catalogs[name]
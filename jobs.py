@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import threading
+
+# Interned command templates, by content
+_templates = {}
+_lock = threading.Lock()
+
+
+""" Part of a command line shared by many jobs: executable (with its own
+options), gem5 configuration script, flags and parameters. Templates are
+interned with get_template, so all the jobs of the same configuration refer
+to the same object. Parameter values are stored as strings. """
+class CommandTemplate(object):
+    __slots__ = ("exe_opts", "script", "flags", "params")
+
+    def __init__(self, exe_opts, script=None, flags=(), params=()):
+        self.exe_opts = exe_opts
+        self.script   = script
+        self.flags    = flags
+        # Sorted tuple of (parameter, value) pairs
+        self.params   = params
+        return
+
+
+# Get the shared template with the given content
+def get_template(exe_opts, script=None, flags=(), params=None):
+    key = (tuple(exe_opts), script, tuple(flags),
+           tuple(sorted((p, str(v)) for p, v in (params or {}).items())))
+    with _lock:
+        template = _templates.get(key)
+        if template is None:
+            template = CommandTemplate(*key)
+            _templates[key] = template
+    return template
+
+
+""" Command line of a job: a shared template, the output folder and the
+parameters which differ from the template (added or overridden). The argument
+vector is only materialized when needed, i.e. when spawning the process. """
+class Command(object):
+    __slots__ = ("template", "outdir", "delta")
+
+    def __init__(self, template, outdir=None, delta=None):
+        self.template = template
+        self.outdir   = outdir
+        self.delta    = delta
+        return
+
+    # Get a copy of this command with some parameters replaced
+    def replace(self, **params):
+        delta = dict(self.delta or {})
+        delta.update((p.replace("_", "-"), str(v)) for p, v in params.items())
+        return Command(self.template, self.outdir, delta)
+
+    def getParam(self, param):
+        if self.delta and param in self.delta:
+            return self.delta[param]
+        return dict(self.template.params).get(param)
+
+    def argv(self):
+        t = self.template
+        argv = [t.exe_opts[0]]
+        if self.outdir:
+            argv.append("--outdir=%s" % self.outdir)
+        argv.extend(t.exe_opts[1:])
+        if t.script:
+            argv.append(t.script)
+        argv.extend("--%s" % f for f in t.flags)
+        if self.delta:
+            params = dict(t.params)
+            params.update(self.delta)
+            params = sorted(params.items())
+        else:
+            params = t.params
+        argv.extend("--%s=%s" % p for p in params)
+        return argv
+
+
+# Command which does not share anything with others (e.g. valgrind)
+def raw_command(argv):
+    return Command(CommandTemplate(tuple(argv)))
+
+
+""" A process to spawn: its command, the name of the file to use as standard
+input (in the working directory, if any), the working directory, the log file
+and the names of the benchmarks it runs. """
+class Job(object):
+    __slots__ = ("cmd", "in_name", "work_path", "log_path", "benches")
+
+    def __init__(self, cmd, in_name, work_path, log_path, benches):
+        self.cmd       = cmd
+        self.in_name   = in_name
+        self.work_path = work_path
+        self.log_path  = log_path
+        self.benches   = benches
+        return
+
+    def argv(self):
+        return self.cmd.argv()
+
+    # Get a copy of this job with another command
+    def withCommand(self, cmd):
+        return Job(cmd, self.in_name, self.work_path, self.log_path,
+            self.benches)
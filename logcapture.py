@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+from collections import deque
+import gzip
+import os
+import threading
+
+# Size of the chunks read from the pipe
+chunk_size = 2**16
+
+
+""" Captures the output of a process through a pipe (to be passed as its
+stdout/stderr) instead of a plain log file. The output is written to
+<log>.gz up to cap bytes; beyond that it is only counted, and the last tail
+bytes are appended when the capture is closed, after a note with the number
+of bytes dropped. The first and the last tail bytes are also kept in memory
+(uncompressed), to classify the outcome of the process without reading the
+file back. The pipe is drained by a dedicated thread, so that the process is
+never blocked by a slow or full log. """
+class LogCapture(object):
+    def __init__(self, log_path, cap, tail, compresslevel=3):
+        self._path  = log_path + ".gz"
+        self._cap   = cap
+        self._tail  = tail
+        self._total = 0
+        self._head  = []
+        self._last  = deque()
+        self._size  = 0
+        read_fd, self._write_fd = os.pipe()
+        self._pipe  = os.fdopen(read_fd, "rb", 0)
+        self._out   = gzip.open(self._path, "wb", compresslevel)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # Write end of the pipe, for the process
+    def fileno(self):
+        return self._write_fd
+
+    # Close the write end in this process, once the process is spawned
+    def spawned(self):
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+        return
+
+    def _run(self):
+        head_size = 0
+        while True:
+            data = self._pipe.read(chunk_size)
+            if not data:
+                break
+            # Write up to the cap
+            if self._total < self._cap:
+                self._out.write(data[:self._cap - self._total])
+            self._total += len(data)
+            # Keep the first and the last bytes
+            if head_size < self._tail:
+                self._head.append(data[:self._tail - head_size])
+                head_size += len(self._head[-1])
+            self._last.append(data)
+            self._size += len(data)
+            while self._last and (self._size - len(self._last[0]) >=
+                   self._tail):
+                self._size -= len(self._last.popleft())
+        self._pipe.close()
+        return
+
+    # Wait until the output ends (all the writers must have exited) and
+    # complete the log file
+    def close(self):
+        self.spawned()
+        if self._out.closed:
+            return
+        self._thread.join()
+        if self._total > self._cap:
+            tail = b"".join(self._last)[-self._tail:] if self._tail else b""
+            # Skip the part of the tail already written
+            start = max(self._total - len(tail), self._cap)
+            self._out.write(("\n[bench5] output truncated: %d bytes " % (
+                start - self._cap) + "dropped\n").encode("utf-8"))
+            self._out.write(tail[start - (self._total - len(tail)):])
+        self._out.close()
+        return
+
+    def getPath(self):
+        return self._path
+
+    # Total size of the output in bytes
+    def size(self):
+        return self._total
+
+    # First and last part of the output, as text
+    def text(self):
+        return b"".join(self._head + list(self._last)).decode("utf-8",
+            "replace")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import os
+import sys
+import threading
+
+python_version = sys.version_info[:2]
+if python_version < (3, 0):
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Exported metrics: name -> (type, help)
+metric_info = {
+    "bench5_jobs_running" : ("gauge",
+        "Number of running processes"),
+    "bench5_jobs_queued" : ("gauge",
+        "Number of processes waiting to be spawned"),
+    "bench5_jobs_completed_total" : ("counter",
+        "Number of processes terminated, successfully or not"),
+    "bench5_jobs_failed_total" : ("counter",
+        "Number of failed processes, by failure cause"),
+    "bench5_jobs_retried_total" : ("counter",
+        "Number of failed processes queued again"),
+    "bench5_host_memory_bytes" : ("gauge",
+        "Total and available memory of the host"),
+    "bench5_host_memory_headroom_ratio" : ("gauge",
+        "Fraction of the host memory available before the watchdog kills " +
+        "a process"),
+    "bench5_job_rss_bytes" : ("gauge",
+        "Resident memory of the running processes, by benchmark"),
+    "bench5_spawn_latency_seconds" : ("summary",
+        "Time from a free slot to the start of a process")
+}
+# Content type of the text exposition format
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Format a set of labels, e.g. {mode="cpt_sim",cause="oom"}
+def fmt_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\")
+        .replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in sorted(labels.items()))
+
+
+""" Collects the metrics of a campaign (see metric_info) and exposes them in
+the Prometheus text format, by periodically writing a file (atomically, so
+that it can be read by the node exporter textfile collector) and/or serving
+it on a local HTTP port. The given constant labels (e.g. run id and host) are
+added to every sample. """
+class MetricsExporter(object):
+    def __init__(self, path=None, port=None, labels=None):
+        self._path   = path
+        self._labels = labels if labels else {}
+        # Samples: name -> {sorted label items: value}
+        self._values = {}
+        self._lock   = threading.Lock()
+        self._server = None
+        if port:
+            self._serve(port)
+        return
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def set(self, name, value, labels=None):
+        with self._lock:
+            self._values.setdefault(name, {})[self._key(labels)] = value
+        return
+
+    def inc(self, name, value=1, labels=None):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        return
+
+    # Add a value to a summary (its sum and count)
+    def observe(self, name, value, labels=None):
+        self.inc(name + "_sum", value, labels)
+        self.inc(name + "_count", 1, labels)
+        return
+
+    # Remove all the samples of a metric
+    def clear(self, name):
+        with self._lock:
+            self._values.pop(name, None)
+        return
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(metric_info):
+                kind, desc = metric_info[name]
+                names = ([name + "_sum", name + "_count"]
+                    if kind == "summary" else [name])
+                if not any(n in self._values for n in names):
+                    continue
+                lines.append("# HELP %s %s" % (name, desc))
+                lines.append("# TYPE %s %s" % (name, kind))
+                for n in names:
+                    for key, value in sorted(self._values.get(n, {}).items()):
+                        labels = dict(self._labels)
+                        labels.update(key)
+                        lines.append("%s%s %s" % (n, fmt_labels(labels),
+                            repr(float(value))))
+        return "\n".join(lines) + "\n"
+
+    # Write the metrics file, if any
+    def write(self):
+        if not self._path:
+            return
+        tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        with open(tmp_path, "w") as out:
+            out.write(self.render())
+        os.rename(tmp_path, self._path)
+        return
+
+    def _serve(self, port):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            # Do not log the requests
+            def log_message(self, *args):
+                return
+
+        self._server = HTTPServer(("127.0.0.1", port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return
+
+    # Stop serving the metrics
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        return
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import itertools
+import random
+
+
+# Enumerate the mixes of k different benchmarks, in a deterministic order
+# Candidates: list of tuples (benchmark name, list of subsets)
+# Mixes are tuples of (benchmark name, subset), sorted by benchmark name, so
+# that permutations of the same mix are generated only once
+def iter_mixes(candidates, k):
+    subsets = {}
+    for b_name, b_subsets in candidates:
+        subsets.setdefault(b_name, [])
+        for ss in b_subsets:
+            if ss not in subsets[b_name]:
+                subsets[b_name].append(ss)
+    for combo in itertools.combinations(sorted(subsets), k):
+        for choice in itertools.product(*[subsets[b] for b in combo]):
+            yield tuple(zip(combo, choice))
+
+
+# Generate all the mixes of k benchmarks, or a uniform sample of them (the
+# same for the same seed), without enumerating them in memory
+# Tuple: (list of mixes, total number of mixes)
+def generate_mixes(candidates, k, sample=None, seed=0):
+    rng = random.Random(seed)
+    mixes, total = [], 0
+    for mix in iter_mixes(candidates, k):
+        total += 1
+        if sample is None or len(mixes) < sample:
+            mixes.append(mix)
+        else:
+            # Reservoir sampling
+            i = rng.randint(0, total - 1)
+            if i < sample:
+                mixes[i] = mix
+    if sample is not None:
+        mixes.sort()
+    return mixes, total
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import os
+import threading
+import time
+
+# System constants needed to convert /proc values
+page_size = os.sysconf("SC_PAGE_SIZE")
+clk_tck   = os.sysconf("SC_CLK_TCK")
+
+
+# Read a whole file from /proc, returning None if the process has vanished
+def read_proc(pid, name):
+    try:
+        with open(os.path.join("/proc", str(pid), name), "r") as pidfile:
+            return pidfile.read()
+    except (IOError, OSError):
+        return None
+
+
+# Parse /proc/[pid]/stat, /proc/[pid]/statm and /proc/[pid]/io
+# Tuple: (rss bytes, user cpu seconds, system cpu seconds, read bytes,
+#         written bytes), or None if the process does not exist anymore
+def read_usage(pid):
+    stat  = read_proc(pid, "stat")
+    statm = read_proc(pid, "statm")
+    if not stat or not statm:
+        return None
+    # The command name may contain spaces, so skip it first
+    fields = stat[stat.rfind(')') + 2:].split()
+    utime = float(fields[11]) / clk_tck
+    stime = float(fields[12]) / clk_tck
+    rss   = int(statm.split()[1]) * page_size
+    rbytes, wbytes = 0, 0
+    # I/O accounting may be unavailable (kernel config or permissions)
+    io_stat = read_proc(pid, "io")
+    if io_stat:
+        for l in io_stat.splitlines():
+            key, _, value = l.partition(":")
+            if key == "read_bytes":
+                rbytes = int(value)
+            elif key == "write_bytes":
+                wbytes = int(value)
+    return (rss, utime, stime, rbytes, wbytes)
+
+
+# Get process Resident Set Size (RSS) in bytes, 0 if it does not exist
+def get_rss(pid):
+    statm = read_proc(pid, "statm")
+    if not statm:
+        return 0
+    return int(statm.split()[1]) * page_size
+
+
+""" Periodically samples the resource usage of all the registered processes
+with a single thread. The sampling interval starts at min_int seconds and is
+doubled (up to max_int) as long as no process changes its RSS significantly,
+so that long steady-state simulations cost almost nothing to monitor. If a
+series path is given on registration, the samples are written there as a
+compact time series (one line per sample) when the process is unregistered. """
+class ResourceSampler(object):
+    def __init__(self, min_int=1., max_int=30., threshold=0.05):
+        self._min_int   = min_int
+        self._max_int   = max_int
+        self._threshold = threshold
+        self._interval  = min_int
+        self._procs     = {}
+        self._lock      = threading.Lock()
+        self._wakeup    = threading.Event()
+        self._stop      = False
+        self._thread    = None
+        return
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return
+
+    def stop(self):
+        self._stop = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return
+
+    def register(self, pid, series_path=None):
+        with self._lock:
+            # Entry: [start time, series path, samples, last sample]
+            self._procs[pid] = [time.time(), series_path, [], None]
+        # Sample new processes as soon as possible
+        self._interval = self._min_int
+        self._wakeup.set()
+        return
+
+    # Stop monitoring a process and write its series
+    def unregister(self, pid):
+        with self._lock:
+            entry = self._procs.pop(pid, None)
+        if entry is None:
+            return
+        start, series_path, samples = entry[:3]
+        if series_path and samples:
+            try:
+                with open(series_path, "w") as out:
+                    out.write("# time rss utime stime read_bytes " +
+                              "write_bytes\n")
+                    for s in samples:
+                        out.write("%.1f %d %.2f %.2f %d %d\n" % (
+                            (s[0] - start,) + s[1:]))
+            except (IOError, OSError):
+                pass
+        return
+
+    # Last known RSS of a process in bytes
+    def rss(self, pid):
+        with self._lock:
+            entry = self._procs.get(pid)
+            return entry[3][0] if entry and entry[3] else 0
+
+    def _sample(self):
+        changed = False
+        with self._lock:
+            pids = list(self._procs)
+        now = time.time()
+        for pid in pids:
+            usage = read_usage(pid)
+            # The process may have terminated in the meantime
+            if usage is None:
+                continue
+            with self._lock:
+                entry = self._procs.get(pid)
+                if entry is None:
+                    continue
+                last = entry[3]
+                if (last is None or abs(usage[0] - last[0]) >
+                        self._threshold * max(last[0], 1)):
+                    changed = True
+                entry[2].append((now,) + usage)
+                entry[3] = usage
+        return changed
+
+    def _run(self):
+        while not self._stop:
+            if self._sample():
+                self._interval = self._min_int
+            else:
+                self._interval = min(self._interval * 2, self._max_int)
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+        return
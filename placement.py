@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import glob
+import os
+import threading
+
+sys_cpu_dir  = os.path.join("/sys", "devices", "system", "cpu")
+sys_node_dir = os.path.join("/sys", "devices", "system", "node")
+
+
+# Parse a CPU list string from sysfs (e.g. "0-3,8-11")
+def parse_cpulist(string):
+    cpus = []
+    for chunk in string.strip().split(','):
+        if not chunk:
+            continue
+        if '-' in chunk:
+            first, last = chunk.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(chunk))
+    return cpus
+
+
+# Read a single line from sysfs, None if not available
+def read_sys(path):
+    try:
+        with open(path, "r") as sysfile:
+            return sysfile.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+# Get the topology of the online CPUs from sysfs
+# List of tuples: (cpu, node, thread siblings)
+def get_topology():
+    online = read_sys(os.path.join(sys_cpu_dir, "online"))
+    if online is None:
+        return []
+    # Map each CPU to its NUMA node (node 0 if there is no NUMA support)
+    cpu_node = {}
+    for node_dir in glob.glob(os.path.join(sys_node_dir, "node[0-9]*")):
+        node = int(os.path.basename(node_dir)[4:])
+        cpulist = read_sys(os.path.join(node_dir, "cpulist"))
+        for cpu in parse_cpulist(cpulist or ""):
+            cpu_node[cpu] = node
+    topology = []
+    for cpu in parse_cpulist(online):
+        siblings = read_sys(os.path.join(sys_cpu_dir, "cpu%d" % cpu,
+            "topology", "thread_siblings_list"))
+        topology.append((cpu, cpu_node.get(cpu, 0),
+            parse_cpulist(siblings) if siblings else [cpu]))
+    return topology
+
+
+""" Assigns a dedicated core to each process and binds its memory to the
+NUMA node of that core. Cores are handed out alternating the NUMA nodes, and
+the first hardware thread of every physical core is used before any of its
+SMT siblings (which are never used if no_smt is set). Placement is applied by
+prefixing the command with numactl or, if missing, taskset. """
+class CorePlacer(object):
+    def __init__(self, no_smt=False, numactl=True, taskset=True):
+        topology = get_topology()
+        nodes = sorted(set(t[1] for t in topology))
+        # Separate the first hardware thread of each core from the others
+        levels = ([], [])
+        for cpu, node, siblings in topology:
+            levels[0 if cpu == min(siblings) else 1].append((cpu, node))
+        if no_smt:
+            levels = (levels[0], [])
+        # Interleave NUMA nodes in each level
+        self._slots = []
+        for level in levels:
+            per_node = [[s for s in level if s[1] == n] for n in nodes]
+            for i in range(max([len(l) for l in per_node] + [0])):
+                self._slots.extend(l[i] for l in per_node if i < len(l))
+        self._numa  = len(nodes) > 1
+        self._tool  = ("numactl" if numactl else
+                       "taskset" if taskset else None)
+        self._free  = list(self._slots)
+        self._lock  = threading.Lock()
+        return
+
+    def size(self):
+        return len(self._slots)
+
+    # Take a free slot, tuple (cpu, node), or None if none is available
+    def acquire(self):
+        with self._lock:
+            return self._free.pop(0) if self._free else None
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._lock:
+            self._free.append(slot)
+            # Keep the preferred order for the next processes
+            self._free.sort(key=self._slots.index)
+        return
+
+    # Command prefix to run a process in the given slot
+    def prefix(self, slot):
+        if slot is None or not self._tool:
+            return []
+        cpu, node = slot
+        if self._tool == "numactl":
+            return (["numactl", "--physcpubind=%d" % cpu] +
+                (["--membind=%d" % node] if self._numa else []))
+        return ["taskset", "-c", str(cpu)]
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import glob
+import gzip
+import heapq
+import json
+import os
+import platform
+import time
+
+# Local modules
+from jobs import Command, Job, get_template
+from postproc import open_any
+
+plan_version = 2
+
+
+# Parse a shard specification (e.g. "2/4", 1-based)
+# Tuple: (index, count), with 0-based index
+def parse_shard(string):
+    try:
+        index, count = [int(x) for x in string.split('/')]
+    except ValueError:
+        raise ValueError("invalid shard %s (expected I/N)" % string)
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("invalid shard %s (expected 1 <= I <= N)" % string)
+    return index - 1, count
+
+
+# Split jobs among shards, balancing the expected cost of each shard
+# Jobs are assigned from the most expensive one to the least loaded shard,
+# with ties broken by position, so the result only depends on the plan
+# List of job positions for the given shard, in the original order
+def shard_jobs(costs, index, count):
+    order = sorted(range(len(costs)), key=lambda i: (-costs[i], i))
+    loads = [(0., s) for s in range(count)]
+    selected = []
+    for i in order:
+        load, shard = heapq.heappop(loads)
+        if shard == index:
+            selected.append(i)
+        heapq.heappush(loads, (load + costs[i], shard))
+    return sorted(selected)
+
+
+""" Full list of jobs of one or more operations, with the expected resources
+of each job, which can be saved to a plan file and executed later (possibly
+split among several hosts). Commands are stored in the compact form used by
+the executor: a table of shared templates, and for each job the template
+index, the output folder and the parameter delta. The file is gzipped if its
+name ends with .gz. """
+class ExecutionPlan(object):
+    def __init__(self, run_id, args):
+        self._data = {
+            "version"   : plan_version,
+            "id"        : run_id,
+            "host"      : platform.node(),
+            "created"   : time.time(),
+            "set"       : args.set[0],
+            "suite"     : args.benchsuite,
+            "arch"      : args.arch,
+            "out_dir"   : args.out_dir,
+            "spec_dir"  : args.spec_dir,
+            "stage_dir" : args.stage_dir,
+            "ops"       : []
+        }
+        # List of tuples: (mode, jobs, expected resources)
+        self._ops = []
+        return
+
+    def getInfo(self, key):
+        return self._data[key]
+
+    def getOps(self):
+        return list(self._ops)
+
+    """ Resources are tuples (expected wall time in seconds, expected memory
+    in bytes), where unknown values are None """
+    def addOp(self, mode, jobs, resources):
+        self._ops.append((mode, list(jobs), list(resources)))
+        return
+
+    # Cost of each job of an operation, for load balancing
+    # Jobs without an expected time weigh as the average known one
+    def _costs(self, resources):
+        known = [r[0] for r in resources if r[0]]
+        default = float(sum(known)) / len(known) if known else 1.
+        return [r[0] or default for r in resources]
+
+    # Get the operations restricted to a shard
+    # List of tuples: (mode, jobs)
+    def shard(self, index, count):
+        ops = []
+        for mode, jobs, resources in self._ops:
+            selected = shard_jobs(self._costs(resources), index, count)
+            ops.append((mode, [jobs[i] for i in selected]))
+        return ops
+
+    def write(self, path):
+        templates, index = [], {}
+        ops = []
+        for mode, jobs, resources in self._ops:
+            records = []
+            for job, (exp_time, exp_mem) in zip(jobs, resources):
+                t = job.cmd.template
+                if id(t) not in index:
+                    index[id(t)] = len(templates)
+                    templates.append([list(t.exe_opts), t.script,
+                        list(t.flags), [list(p) for p in t.params]])
+                records.append({
+                    "t"     : index[id(t)],
+                    "out"   : job.cmd.outdir,
+                    "delta" : job.cmd.delta or {},
+                    "cwd"   : job.work_path,
+                    "stdin" : job.in_name,
+                    "log"   : job.log_path,
+                    "bench" : list(job.benches),
+                    "time"  : exp_time,
+                    "mem"   : exp_mem
+                })
+            ops.append({"mode": mode, "jobs": records})
+        data = dict(self._data, templates=templates, ops=ops)
+        # Only ASCII characters are produced (non-ASCII ones are escaped)
+        text = json.dumps(data, separators=(",", ":"), sort_keys=True)
+        tmp_path = path + ".tmp"
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(tmp_path, "wb") as out:
+            out.write(text.encode("ascii"))
+        os.rename(tmp_path, path)
+        return
+
+    @staticmethod
+    def load(path):
+        with open_any(path) as plan_file:
+            data = json.load(plan_file)
+        if data.get("version") != plan_version:
+            raise ValueError("unsupported plan version in %s" % path)
+        templates = [get_template(e, s, f, dict(p))
+            for e, s, f, p in data.pop("templates")]
+        plan = ExecutionPlan.__new__(ExecutionPlan)
+        plan._ops = []
+        for op in data["ops"]:
+            jobs, resources = [], []
+            for r in op["jobs"]:
+                cmd = Command(templates[r["t"]], r["out"], r["delta"] or None)
+                jobs.append(Job(cmd, r["stdin"], r["cwd"], r["log"],
+                    tuple(r["bench"])))
+                resources.append((r["time"], r["mem"]))
+            plan._ops.append((op["mode"], jobs, resources))
+        data["ops"] = []
+        plan._data = data
+        return plan
+
+
+# Path of the run manifest of a shard of a plan
+def shard_manifest(out_dir, plan_id, index, count):
+    return os.path.join(out_dir, "manifest_%s_%dof%d.json" % (
+        plan_id, index + 1, count))
+
+
+# Merge the run manifests of the shards of a plan into a single one
+# (manifest_<plan id>.json), removing the merged ones
+# Tuple: (number of merged shards, list of log paths of the jobs not run)
+def merge_results(plan, out_dir):
+    plan_id = plan.getInfo("id")
+    merged, ops, paths = None, {}, []
+    for m_path in sorted(glob.glob(os.path.join(out_dir,
+            "manifest_%s_*of*.json" % plan_id))):
+        with open(m_path, "r") as m_file:
+            data = json.load(m_file)
+        paths.append(m_path)
+        if merged is None:
+            merged = dict(data, id=plan_id, host=[], ops=[])
+        merged["host"].append(data["host"])
+        # Shards without jobs for an operation do not record it
+        for other in data["ops"]:
+            op = ops.get(other["mode"])
+            if op is None:
+                ops[other["mode"]] = other
+                continue
+            op["start"] = min(op["start"], other["start"])
+            op["end"] = max(op["end"], other["end"])
+            op["max_proc"] += other["max_proc"]
+            op["jobs"].extend(other["jobs"])
+    if merged is None:
+        return 0, []
+    merged["ops"] = [ops[mode] for mode, jobs, res in plan.getOps()
+        if mode in ops]
+    done = set(j["log"] for op in merged["ops"] for j in op["jobs"]
+        if not j["retry"])
+    missing = [j.log_path for mode, jobs, res in plan.getOps() for j in jobs
+        if j.log_path not in done]
+    out_path = os.path.join(out_dir, "manifest_%s.json" % plan_id)
+    with open(out_path + ".tmp", "w") as out:
+        json.dump(merged, out, indent=1, sort_keys=True)
+    os.rename(out_path + ".tmp", out_path)
+    for m_path in paths:
+        os.remove(m_path)
+    return len(paths), missing
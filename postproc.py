@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import fnmatch
+import gzip
+import io
+import os
+import re
+import shutil
+import sys
+import threading
+
+python_version = sys.version_info[:2]
+if python_version < (3, 0):
+    import Queue as queue
+else:
+    import queue
+if python_version < (3, 2):
+    import subprocess32 as subprocess
+else:
+    import subprocess
+
+# Suffixes of the supported compressed formats
+suffixes = {
+    "gzip" : ".gz",
+    "zstd" : ".zst"
+}
+
+
+# Find a file in plain or compressed form, None if not present
+def find_any(path, methods=("gzip", "zstd")):
+    for p in [path] + [path + suffixes[m] for m in methods]:
+        if os.path.isfile(p):
+            return p
+    return None
+
+
+# Open a file for reading in text mode, transparently decompressing it
+def open_any(path, encoding="utf-8", errors="replace"):
+    real_path = find_any(path)
+    if real_path is None:
+        raise IOError("missing file %s" % path)
+    if real_path.endswith(suffixes["gzip"]):
+        raw = gzip.open(real_path, "rb")
+        # Python 2 gzip files cannot be wrapped directly
+        if python_version < (3, 0):
+            raw = io.BytesIO(raw.read())
+    elif real_path.endswith(suffixes["zstd"]):
+        proc = subprocess.Popen(["zstd", "-dcq", real_path],
+            stdout=subprocess.PIPE)
+        raw = io.BytesIO(proc.communicate()[0])
+    else:
+        raw = io.open(real_path, "rb")
+    return io.TextIOWrapper(raw, encoding=encoding, errors=errors)
+
+
+# Compress a file, replacing the original one
+# External multi-threaded tools are used if available (with low priority)
+def compress_file(path, method, threads=1, tools=()):
+    if method == "zstd" and "zstd" in tools:
+        cmd = ["zstd", "-q", "-f", "--rm", "-T%d" % threads, path]
+    elif method == "gzip" and "pigz" in tools:
+        cmd = ["pigz", "-f", "-p", str(threads), path]
+    else:
+        # Fall back to the gzip module
+        dest_path = path + suffixes["gzip"]
+        with open(path, "rb") as f_in:
+            with gzip.open(dest_path + ".tmp", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, 2**20)
+        os.rename(dest_path + ".tmp", dest_path)
+        os.remove(path)
+        return dest_path
+    tool = cmd[0]
+    if "nice" in tools:
+        cmd = ["nice", "-n", "19"] + cmd
+    ret = subprocess.call(cmd)
+    if ret != 0:
+        raise OSError("%s exited with status %d compressing %s" % (tool,
+            ret, path))
+    return path + suffixes[method]
+
+
+# Read the last statistics dump of a gem5 stats file
+# Ordered list of tuples: (name, value)
+def read_stats(path):
+    stats = []
+    with open_any(path) as stats_file:
+        for l in stats_file:
+            if "Begin Simulation Statistics" in l:
+                stats = []
+                continue
+            fields = l.split()
+            if len(fields) < 2 or fields[0].startswith("-"):
+                continue
+            try:
+                stats.append((fields[0], float(fields[1])))
+            except ValueError:
+                continue
+    return stats
+
+
+# Weight of a simpoint folder (named *_weight_<weight>*), or None
+def folder_weight(name):
+    match = re.search(r'_weight_([0-9.eE+-]+?)(?:_|$)', name)
+    return float(match.group(1)) if match else None
+
+
+# Combine the statistics of the simpoint folders (named *_weight_<weight>*)
+# inside a folder, weighting each value by the normalized simpoint weight
+# Return the number of combined simpoints
+def weighted_stats(folder, prefix, stats_name="stats.txt",
+                   out_name="stats.weighted.txt"):
+    results = []
+    for d in sorted(os.listdir(folder)):
+        weight = folder_weight(d)
+        stats_path = os.path.join(folder, d, stats_name)
+        # Failed simpoints are renamed, so they are skipped here
+        if (not d.startswith(prefix) or weight is None or
+            not find_any(stats_path)):
+            continue
+        results.append((d, weight, read_stats(stats_path)))
+    total = sum(r[1] for r in results)
+    if not results or total <= 0:
+        return 0
+    combined, names = {}, []
+    for d, weight, stats in results:
+        for name, value in stats:
+            if name not in combined:
+                combined[name] = 0.
+                names.append(name)
+            combined[name] += value * weight / total
+    with open(os.path.join(folder, out_name), "w") as out:
+        out.write("# Weighted statistics from %d simpoints " % len(results) +
+                  "(total weight %.4f)\n" % total)
+        for d, weight, stats in results:
+            out.write("#   %s\n" % d)
+        for name in names:
+            out.write("%-60s %.6f\n" % (name, combined[name]))
+    return len(results)
+
+
+""" Compresses the artifacts of the finished processes off the critical path.
+Output folders are fed through a bounded queue (so that the executor slows
+down rather than piling up work if compression cannot keep up) to a pool of
+worker threads, which compress all the files matching the given patterns.
+Protobuf traces are always compressed with gzip, the only format that gem5
+is able to read. """
+class PostProcessor(object):
+    def __init__(self, method, patterns, workers=2, threads=1, tools=(),
+                 queue_size=64):
+        self._method   = method
+        self._patterns = patterns
+        self._threads  = threads
+        self._tools    = tools
+        self._queue    = queue.Queue(queue_size)
+        self._workers  = []
+        self._errors   = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        return
+
+    def submit(self, out_path):
+        self._queue.put(out_path)
+        return
+
+    # Wait for all the submitted folders to be processed and stop the pool
+    # Return the list of errors, if any
+    def join(self):
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        return self._errors
+
+    def _process(self, out_path):
+        for root, dirs, files in os.walk(out_path):
+            # Temporary folders only contain links to the input data
+            if "tmp" in dirs:
+                dirs.remove("tmp")
+            for name in files:
+                if any(name.endswith(s) for s in suffixes.values()):
+                    continue
+                if not any(fnmatch.fnmatch(name, p) for p in self._patterns):
+                    continue
+                method = "gzip" if name.endswith(".proto") else self._method
+                compress_file(os.path.join(root, name), method,
+                    self._threads, self._tools)
+        return
+
+    def _run(self):
+        while True:
+            out_path = self._queue.get()
+            if out_path is None:
+                break
+            try:
+                self._process(out_path)
+            except (IOError, OSError) as e:
+                self._errors.append(str(e))
+        return
+
+
+""" Removes folders off the critical path. Each folder is first moved to a
+trash area on the same filesystem (an atomic rename, so that its path can be
+reused right away), then deleted by a worker thread with low CPU and I/O
+priority. Folders which cannot be moved (e.g. on another filesystem) are
+deleted right away instead. """
+class DeletionQueue(object):
+    def __init__(self, trash_dir, tools=()):
+        self._trash  = trash_dir
+        self._tools  = tools
+        self._count  = 0
+        self._queue  = queue.Queue()
+        self._errors = []
+        self._lock   = threading.Lock()
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+        return
+
+    # Move a folder to the trash and queue it for deletion
+    def submit(self, path):
+        with self._lock:
+            self._count += 1
+            dest_path = os.path.join(self._trash, "%d_%s" % (self._count,
+                os.path.basename(path)))
+            try:
+                if not os.path.isdir(self._trash):
+                    os.makedirs(self._trash, mode=0o755)
+                os.rename(path, dest_path)
+            except OSError:
+                dest_path = None
+        if dest_path is None:
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                self._errors.append(str(e))
+            return
+        self._queue.put(dest_path)
+        return
+
+    # Wait for all the submitted folders to be deleted and stop the worker
+    # Return the list of errors, if any
+    def join(self):
+        self._queue.put(None)
+        self._worker.join()
+        shutil.rmtree(self._trash, ignore_errors=True)
+        return self._errors
+
+    def _delete(self, path):
+        if "rm" not in self._tools:
+            shutil.rmtree(path)
+            return
+        cmd = ["rm", "-rf", path]
+        if "ionice" in self._tools:
+            cmd = ["ionice", "-c", "3"] + cmd
+        if "nice" in self._tools:
+            cmd = ["nice", "-n", "19"] + cmd
+        if subprocess.call(cmd) != 0:
+            raise OSError("cannot delete %s" % path)
+        return
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                self._delete(path)
+            except (IOError, OSError) as e:
+                self._errors.append(str(e))
+        return
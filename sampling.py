@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import math
+import os
+import threading
+# Local modules
+from postproc import read_stats
+
+# Two-sided standard normal quantiles, by confidence level
+z_values = {
+    0.90 : 1.645,
+    0.95 : 1.960,
+    0.99 : 2.576
+}
+# Delimiters of a statistics dump in gem5 stats files
+dump_begin = "Begin Simulation Statistics"
+dump_end   = "End Simulation Statistics"
+
+
+# Get the CPI of a statistics dump (the first valid *.cpi value, or the
+# ratio of cycles to committed instructions)
+def dump_cpi(stats):
+    cycles, insts = None, None
+    for name, value in stats:
+        if name.endswith(".cpi") and value > 0 and not math.isinf(value):
+            return value
+        if name.endswith(".numCycles") and cycles is None:
+            cycles = value
+        elif name.endswith(".committedInsts") and insts is None:
+            insts = value
+    if cycles and insts:
+        return cycles / insts
+    return None
+
+
+# Read the statistics dumps completed after the given offset of a stats file
+# Tuple: (list of CPI values of the dumps, new offset)
+def read_windows(path, offset):
+    try:
+        with open(path, "rb") as stats_file:
+            stats_file.seek(offset)
+            data = stats_file.read()
+    except (IOError, OSError):
+        return [], offset
+    values, stats, pos, consumed = [], None, 0, 0
+    for l in data.splitlines(True):
+        pos += len(l)
+        if not l.endswith(b"\n"):
+            # Partially written line
+            break
+        l = l.decode("utf-8", "replace")
+        if dump_begin in l:
+            stats = []
+        elif dump_end in l and stats is not None:
+            cpi = dump_cpi(stats)
+            if cpi is not None:
+                values.append(cpi)
+            stats = None
+            consumed = pos
+        elif stats is not None:
+            fields = l.split()
+            if len(fields) >= 2 and not fields[0].startswith("-"):
+                try:
+                    stats.append((fields[0], float(fields[1])))
+                except ValueError:
+                    pass
+    return values, offset + consumed
+
+
+""" Running mean and variance of the per-window CPI (Welford's algorithm),
+with the confidence interval of the mean under the normal approximation. """
+class OnlineEstimate(object):
+    def __init__(self, conf):
+        self._z    = z_values[conf]
+        self._n    = 0
+        self._mean = 0.
+        self._m2   = 0.
+        return
+
+    def add(self, value):
+        self._n += 1
+        delta = value - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (value - self._mean)
+        return
+
+    def count(self):
+        return self._n
+
+    def mean(self):
+        return self._mean
+
+    # Half width of the confidence interval, None with less than 2 values
+    def halfWidth(self):
+        if self._n < 2:
+            return None
+        return self._z * math.sqrt(self._m2 / (self._n - 1) / self._n)
+
+    # Half width relative to the mean, None if unknown
+    def relError(self):
+        hw = self.halfWidth()
+        if hw is None or self._mean <= 0:
+            return None
+        return hw / self._mean
+
+
+""" Follows the statistics dumps of the sampled simulations while they run
+(one dump per measured window) and tells which ones have reached the target
+relative error of the mean CPI, with at least min_windows windows, so that
+they can be stopped. A summary of the estimate is written next to the stats
+file at the end of each simulation. """
+class SamplingMonitor(object):
+    def __init__(self, error, conf, min_windows, summary="sampling.txt"):
+        self._error   = error
+        self._conf    = conf
+        self._min     = max(min_windows, 2)
+        self._summary = summary
+        # Entry: [stats path, offset, estimate, stop requested]
+        self._procs   = {}
+        self._lock    = threading.Lock()
+        return
+
+    def register(self, key, out_path):
+        with self._lock:
+            self._procs[key] = [os.path.join(out_path, "stats.txt"), 0,
+                OnlineEstimate(self._conf), False]
+        return
+
+    def _update(self, entry):
+        values, entry[1] = read_windows(entry[0], entry[1])
+        for v in values:
+            entry[2].add(v)
+        return
+
+    # Read the new windows of all the simulations
+    # Return the keys of the ones which have reached the target error
+    def poll(self):
+        with self._lock:
+            entries = list(self._procs.items())
+        done = []
+        for key, entry in entries:
+            if entry[3]:
+                continue
+            self._update(entry)
+            est = entry[2]
+            err = est.relError()
+            if (est.count() >= self._min and err is not None and
+                err <= self._error):
+                entry[3] = True
+                done.append(key)
+        return done
+
+    # Stop following a simulation and write its summary
+    # Return the estimate, or None if not registered
+    def unregister(self, key):
+        with self._lock:
+            entry = self._procs.pop(key, None)
+        if entry is None:
+            return None
+        self._update(entry)
+        est = entry[2]
+        err = est.relError()
+        with open(os.path.join(os.path.dirname(entry[0]), self._summary),
+                  "w") as out:
+            out.write("windows          %d\n" % est.count())
+            out.write("cpi_mean         %.6f\n" % est.mean())
+            out.write("cpi_half_width   %s\n" % ("%.6f" % est.halfWidth()
+                if est.halfWidth() is not None else "nan"))
+            out.write("cpi_rel_error    %s\n" % ("%.6f" % err
+                if err is not None else "nan"))
+            out.write("confidence       %.2f\n" % self._conf)
+            out.write("target_reached   %d\n" % entry[3])
+        return est
+
+
+""" Tracks the weighted CPI of groups of simpoint simulations (e.g. the
+checkpoints of a benchmark with a given configuration) as their results
+arrive, the heaviest simpoints first. Assuming that the CPI of the simpoints
+not simulated yet is in the range of the ones seen so far, they can move the
+estimate by at most their total weight times the width of that range: a
+group has converged when this bound, relative to the estimate, is within the
+target error, with at least min_points results covering at least min_weight
+of the total weight. This is a heuristic, not a statistical guarantee: a
+few similar early results give a narrow range, so the covered weight limits
+how much of the group can be cancelled on their basis. """
+class ConvergenceTracker(object):
+    def __init__(self, error, min_points, min_weight,
+                 summary="convergence.txt"):
+        self._error   = error
+        self._min     = max(min_points, 1)
+        self._weight  = min_weight
+        self._summary = summary
+        # Entry: [expected weight, list of (weight, cpi), converged]
+        self._groups  = {}
+        self._lock    = threading.Lock()
+        return
+
+    # Add a simpoint to be simulated in a group
+    def expect(self, group, weight):
+        with self._lock:
+            self._groups.setdefault(group, [0., [], False])[0] += weight
+        return
+
+    # Tuple: (estimate, relative error bound), or (None, None)
+    def _estimate(self, entry):
+        total, results = entry[0], entry[1]
+        observed = sum(w for w, v in results)
+        if observed <= 0 or total <= 0:
+            return None, None
+        est = sum(w * v for w, v in results) / observed
+        if est <= 0:
+            return est, None
+        values = [v for w, v in results]
+        left = max(total - observed, 0.) / total
+        return est, left * (max(values) - min(values)) / est
+
+    # Add the result of a simpoint of a group
+    # Return True if the group has converged with this result
+    def add(self, group, weight, value):
+        with self._lock:
+            entry = self._groups.get(group)
+            if entry is None or entry[2]:
+                return False
+            entry[1].append((weight, value))
+            est, bound = self._estimate(entry)
+            covered = sum(w for w, v in entry[1])
+            if (len(entry[1]) >= self._min and bound is not None and
+                covered >= self._weight * entry[0] and
+                bound <= self._error):
+                entry[2] = True
+        return entry[2]
+
+    # Write the summary of a group in its folder, with the number of
+    # simulations cancelled
+    def write(self, group, cancelled):
+        with self._lock:
+            entry = self._groups[group]
+            est, bound = self._estimate(entry)
+            observed = sum(w for w, v in entry[1])
+        with open(os.path.join(group, self._summary), "w") as out:
+            out.write("simpoints        %d\n" % len(entry[1]))
+            out.write("cancelled        %d\n" % cancelled)
+            out.write("weight           %.6f\n" % observed)
+            out.write("total_weight     %.6f\n" % entry[0])
+            out.write("cpi_estimate     %s\n" % ("%.6f" % est
+                if est is not None else "nan"))
+            out.write("cpi_rel_bound    %s\n" % ("%.6f" % bound
+                if bound is not None else "nan"))
+        return
+
+
+# CPI of the last statistics dump of a stats file, None if not available
+def stats_cpi(path):
+    try:
+        return dump_cpi(read_stats(path))
+    except (IOError, OSError):
+        return None
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import argparse
+import bisect
+import glob
+import heapq
+import itertools
+import json
+import os
+import re
+import sys
+
+# Local modules
+import bench5
+from accounting import TimeoutPolicy, fmt_time
+from jobs import raw_command
+from postproc import find_any, open_any
+from scheduler import JobQueue, host_mem_min, select_victim, spawn_interval
+from simclass import sizenum
+
+# Job orderings, as sort keys
+orders = {
+    "fifo" : lambda j: j.queued,
+    "lpt"  : lambda j: -j.wall,
+    "spt"  : lambda j: j.wall,
+    "mem"  : lambda j: -j.peak
+}
+# Failure causes decided by the watchdog, and not replayed as recorded
+watchdog_causes = ("timeout", "hostmem")
+# Memory size of the simulated system in a recorded command
+mem_param = re.compile(r"--mem-size[= ](\S+)")
+
+
+def log(string):
+    print("[schedsim] %s" % string)
+    sys.stdout.flush()
+
+
+""" Job recorded in a previous campaign: the attempts made (wall time, peak
+RSS and failure cause) and the memory curve of the last one (from the .res
+file next to the log, or the peak RSS if missing). Failures caused by the
+job itself (e.g. oom) are replayed as recorded, while the ones caused by the
+watchdog (timeout, hostmem) are decided by the replay: attempts killed this
+way only provide a lower bound of their wall time. The command only carries
+the memory size of the simulated system, for the retry policy. """
+class SimJob(object):
+    __slots__ = ("log_path", "benches", "mode", "queued", "cmd", "attempts",
+                 "index", "wall", "peak", "cause", "times", "rss_values",
+                 "killed")
+
+    def __init__(self, mode, records):
+        record = records[0]
+        self.log_path   = record["log"]
+        self.benches    = tuple(record["bench"])
+        self.mode       = mode
+        self.queued     = (record["queued"], record["start"])
+        mem_size = mem_param.search(record.get("cmd", ""))
+        self.cmd        = (raw_command(()).replace(mem_size=mem_size.group(1))
+            if mem_size else raw_command(()))
+        # Tuple: (wall time, peak RSS, failure cause)
+        self.attempts   = [(r["wall"], r["maxrss"], r["fail"])
+            for r in records]
+        self.times      = []
+        self.rss_values = []
+        self.killed     = records[-1]["fail"] in watchdog_causes
+        self._setAttempt(0)
+        return
+
+    # Select a recorded attempt: its failure cause is None if successful or
+    # decided by the replay
+    def _setAttempt(self, index):
+        self.index = index
+        self.wall, self.peak, cause = self.attempts[index]
+        self.cause = None if cause in watchdog_causes else cause
+        return
+
+    # Get a copy of this job with another command
+    def withCommand(self, cmd):
+        job = SimJob.__new__(SimJob)
+        for attr in SimJob.__slots__:
+            setattr(job, attr, getattr(self, attr))
+        job.cmd = cmd
+        return job
+
+    # Start again from the first recorded attempt (the jobs are shared by
+    # all the replays, and the retries move them to the next attempts)
+    def reset(self):
+        self._setAttempt(0)
+        return
+
+    # Move to the next recorded attempt (the last one is repeated if the
+    # replay retries the job more times than the campaign did)
+    def nextAttempt(self):
+        self._setAttempt(min(self.index + 1, len(self.attempts) - 1))
+        return
+
+    # Load the memory curve of the last attempt from a resource usage series
+    def loadCurve(self, res_path):
+        with open_any(res_path) as res_file:
+            for l in res_file:
+                fields = l.split()
+                if l.startswith("#") or len(fields) < 2:
+                    continue
+                self.times.append(float(fields[0]))
+                self.rss_values.append(int(fields[1]))
+        return
+
+    # RSS at t seconds from the start
+    def rss(self, t):
+        if not self.times or self.index < len(self.attempts) - 1:
+            return self.peak
+        return self.rss_values[max(bisect.bisect_right(self.times, t) - 1, 0)]
+
+
+# Load the jobs from the run manifests in the given paths (manifest files or
+# folders containing them), with all their attempts. The attempts killed by
+# the watchdog are dropped when followed by others, as the replay decides
+# whether to kill the job
+def load_jobs(paths, modes):
+    records = {}
+    for p in paths:
+        m_paths = (sorted(glob.glob(os.path.join(p, "manifest_*.json")))
+            if os.path.isdir(p) else [p])
+        for m_path in m_paths:
+            with open(m_path, "r") as m_file:
+                data = json.load(m_file)
+            for op in data["ops"]:
+                if modes and op["mode"] not in modes:
+                    continue
+                for j in op["jobs"]:
+                    if not j.get("bench"):
+                        continue
+                    records.setdefault((op["mode"], j["log"]), []).append(j)
+    jobs = []
+    for (mode, log_path), attempts in records.items():
+        attempts = [a for a in attempts[:-1]
+            if a["fail"] not in watchdog_causes] + attempts[-1:]
+        job = SimJob(mode, attempts)
+        res_path = find_any(os.path.splitext(log_path)[0] + ".res")
+        if res_path:
+            job.loadCurve(res_path)
+        jobs.append(job)
+    return sorted(jobs, key=lambda j: j.queued)
+
+
+""" Replays jobs in simulated time with the scheduling logic of the executor:
+the same queue and retry policy, at most max_proc processes (minus the
+withheld slots), one spawn per spawn interval and the watchdog, which kills
+the largest process when the host memory runs low and any process exceeding
+its time limit. The other failures are replayed as recorded and re-queued
+by the retry policy, each retry following the next recorded attempt. Only
+the memory of the jobs is accounted on the host. """
+def replay(jobs, max_proc, host_mem, limits, retries):
+    for job in jobs:
+        job.reset()
+    queue = JobQueue(jobs, bench5.retry_policy, retries)
+    seq = itertools.count()
+    running = {}
+    events = []
+    stats = {"busy": 0., "useful": 0., "done": 0, "failed": 0, "retried": 0,
+             "timeout": 0, "hostmem": 0, "replayed": 0}
+    now, next_spawn = 0., 0.
+
+    def used():
+        return sum(j.rss(now - start) for j, start in running.values())
+
+    def stop(key, cause):
+        job, start = running.pop(key)
+        stats["busy"] += now - start
+        if cause is None:
+            stats["done"] += 1
+            stats["useful"] += now - start
+            return
+        stats[cause] = stats.get(cause, 0) + 1
+        if cause not in watchdog_causes:
+            stats["replayed"] += 1
+        action = queue.requeue(job, cause, job.rss(now - start),
+            lambda j, attempt: j.nextAttempt())
+        if action:
+            stats["retried"] += 1
+            if action == "slot":
+                queue.holdSlot(max_proc)
+        else:
+            stats["failed"] += 1
+        return
+
+    while True:
+        # Spawn the queued jobs
+        while (queue and now >= next_spawn and
+               len(running) < max_proc - queue.held()):
+            avail = host_mem - used() if queue.needsMemory() else 0
+            job = queue.pop(avail, bool(running))
+            next_spawn = now + spawn_interval
+            if job is None:
+                break
+            key = next(seq)
+            running[key] = (job, now)
+            heapq.heappush(events, (now + job.wall, key, "end"))
+            limit = limits.get(job.mode, job.benches)
+            if limit and limit < job.wall:
+                heapq.heappush(events, (now + limit, key, "timeout"))
+            for t in job.times:
+                if t < job.wall:
+                    heapq.heappush(events, (now + t, key, "mem"))
+        if not running and not queue:
+            break
+        # Advance to the next event
+        candidates = [events[0][0]] if events else []
+        if queue and len(running) < max_proc - queue.held():
+            candidates.append(next_spawn)
+        now = max(now, min(candidates))
+        while events and events[0][0] <= now:
+            t, key, kind = heapq.heappop(events)
+            if key not in running:
+                continue
+            if kind == "end":
+                # Replay the failure of the attempt, if any
+                stop(key, running[key][0].cause)
+            elif kind == "timeout":
+                stop(key, "timeout")
+        # Watchdog memory monitoring
+        while running and used() > (1 - host_mem_min) * host_mem:
+            stop(select_victim(dict((k, j.rss(now - s))
+                for k, (j, s) in running.items())), "hostmem")
+
+    stats["makespan"] = now
+    stats["util"] = stats["busy"] / (max_proc * now) if now else 0.
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the execution " +
+        "of previous bench5 campaigns with different scheduling policies")
+    parser.add_argument("paths", nargs="+", type=bench5.path,
+        help="run manifests, or output folders containing them")
+    parser.add_argument("--mode", action="append", type=str, default=[],
+        help="only replay the jobs of this mode (default: all)")
+    parser.add_argument("--max-proc", action="store", type=int, nargs="+",
+        metavar="N", default=[int(os.sysconf('SC_NPROCESSORS_ONLN'))],
+        help="numbers of concurrent processes to try (default: %(default)s)")
+    parser.add_argument("--order", action="store", type=str, nargs="+",
+        choices=sorted(orders), default=["fifo"], help="job orderings to " +
+        "try: as recorded, longest or shortest first, largest memory " +
+        "first (default: fifo)")
+    parser.add_argument("--host-mem", action="store", type=str, nargs="+",
+        metavar="SIZE", help="host memory sizes to try (default: this host)")
+    parser.add_argument("--timeout", action="append", type=bench5.timeout,
+        metavar="[KEY=]TIME", default=[], help="time limits, as in bench5 " +
+        "(default: cpt_sim=6h)")
+    parser.add_argument("--auto-timeout", action="store", type=float,
+        metavar="F", help="derive time limits from the replayed jobs, as " +
+        "in bench5")
+    parser.add_argument("--retry", action="store", type=int, metavar="N",
+        default=0, help="re-queue killed processes up to N times, as in " +
+        "bench5 (default: %(default)s)")
+    parser.add_argument("--json", action="store", type=str, metavar="FILE",
+        help="also write the results to FILE")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.paths, args.mode)
+    if not jobs:
+        log("error: no jobs found")
+        exit(1)
+    killed = sum(1 for j in jobs if j.killed)
+    log("replaying %d jobs (%d with memory curve)" % (len(jobs),
+        sum(1 for j in jobs if j.times)))
+    if killed:
+        log("warning: %d jobs were killed, their runtime is a lower bound" % (
+            killed))
+    history = {}
+    for j in jobs:
+        if not j.killed:
+            history.setdefault((j.mode, "+".join(j.benches)), []).append(
+                j.attempts[-1][0])
+    limits = TimeoutPolicy(dict(args.timeout), bench5.default_timeouts,
+        args.auto_timeout, history)
+    host_mems = ([sizenum(m) for m in args.host_mem] if args.host_mem
+        else [bench5.get_host_mem()[0] * 1024])
+
+    results = []
+    log("%8s %6s %8s %12s %6s %6s %6s %7s %7s %8s" % ("max-proc",
+        "order", "host-mem", "makespan", "util", "done", "failed",
+        "timeout", "hostmem", "replayed"))
+    for max_proc, order, host_mem in itertools.product(args.max_proc,
+            args.order, host_mems):
+        stats = replay(sorted(jobs, key=orders[order]), max_proc, host_mem,
+            limits, args.retry)
+        stats.update({"max_proc": max_proc, "order": order,
+            "host_mem": host_mem})
+        results.append(stats)
+        log("%8d %6s %7dG %12s %5d%% %6d %6d %7d %7d %8d" % (max_proc,
+            order, host_mem // 2**30, fmt_time(stats["makespan"]),
+            stats["util"] * 100, stats["done"], stats["failed"],
+            stats["timeout"], stats["hostmem"], stats["replayed"]))
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=1, sort_keys=True)
+    return
+
+if __name__ == "__main__":
+    main()
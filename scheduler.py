@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+from collections import deque
+import threading
+
+# Local modules
+from simclass import sizenum
+
+# Minimum fraction of available host memory kept by the watchdog
+host_mem_min = 0.1
+# Seconds between two spawns, and between two attempts if none is possible
+spawn_interval = 1.
+
+
+# Multiply the memory size parameter of a gem5 command, if present
+def scale_mem_size(cmd, factor):
+    mem_size = cmd.getParam("mem-size")
+    if mem_size is None:
+        return None
+    size = sizenum(mem_size) * factor
+    return cmd.replace(mem_size="%dMB" % (size // 2**20))
+
+
+# Choose the process to kill when the host is running out of memory
+# Return the key of the largest process in a dict {key: rss}, or None
+def select_victim(usage):
+    victim, largest = None, 0
+    for key, rss in usage.items():
+        if rss > largest:
+            victim, largest = key, rss
+    return victim
+
+
+""" Queue of the jobs waiting to be spawned, shared by the executor and the
+scheduling simulator. Failed jobs are re-queued according to the retry
+policy, i.e. a dict with the action to take for each failure cause:
+- mem  : double the memory size of the simulated system
+- slot : wait for enough free host memory and lower the concurrency
+Jobs are identified by their log path. """
+class JobQueue(object):
+    def __init__(self, jobs, policy, retries):
+        self._queue    = deque(jobs)
+        self._policy   = policy
+        self._retries  = retries
+        # Number of previous attempts and host memory needed, by log path
+        self._attempts = {}
+        self._needs    = {}
+        # Number of concurrency slots withheld
+        self._held     = 0
+        self._lock     = threading.Lock()
+        return
+
+    def __len__(self):
+        return len(self._queue)
+
+    # Whether the available host memory is needed to choose the next job
+    def needsMemory(self):
+        return bool(self._needs)
+
+    def held(self):
+        return self._held
+
+    # Take the first queued job whose memory needs fit in avail bytes (any
+    # job if nothing is running), or None. The needs are forgotten once the
+    # job is dispatched, and set again if it fails for lack of memory
+    def pop(self, avail, running):
+        with self._lock:
+            for job in self._queue:
+                if self._needs.get(job.log_path, 0) <= avail or not running:
+                    self._queue.remove(job)
+                    self._needs.pop(job.log_path, None)
+                    return job
+        return None
+
+    # Re-queue a failed job if the failure cause allows it, calling
+    # on_retry(job, previous attempts) before the job is queued again
+    # Return the action taken, or None if not re-queued
+    def requeue(self, job, cause, maxrss, on_retry=None):
+        attempt = self._attempts.get(job.log_path, 0)
+        action = self._policy.get(cause)
+        if not action or attempt >= self._retries:
+            return None
+        if action == "mem":
+            cmd = scale_mem_size(job.cmd, 2)
+            if not cmd:
+                return None
+            job = job.withCommand(cmd)
+        elif action == "slot":
+            # Wait until the host can hold the previous memory peak, or the
+            # memory of the simulated system if larger (e.g. on alloc, the
+            # process fails before using much memory)
+            mem_size = job.cmd.getParam("mem-size")
+            with self._lock:
+                self._needs[job.log_path] = max(maxrss,
+                    sizenum(mem_size) if mem_size else 0)
+        self._attempts[job.log_path] = attempt + 1
+        if on_retry:
+            on_retry(job, attempt)
+        with self._lock:
+            self._queue.append(job)
+        return action
+
+    # Remove the queued jobs for which match(job) is true
+    # Return the list of removed jobs
+    def cancel(self, match):
+        with self._lock:
+            removed = [job for job in self._queue if match(job)]
+            for job in removed:
+                self._queue.remove(job)
+                self._needs.pop(job.log_path, None)
+        return removed
+
+    # Lower the concurrency by withholding a slot, keeping at least one
+    # Return True if the slot has been withheld
+    def holdSlot(self, max_proc):
+        with self._lock:
+            if max_proc - self._held > 1:
+                self._held += 1
+                return True
+        return False
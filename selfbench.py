@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import argparse
+import glob
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Local modules
+import bench5
+from accounting import RunManifest
+import benchsuites
+from monitor import get_rss
+from postproc import find_any
+from simclass import CptSimulation, sizenum
+import simpoints
+
+# Stand-in for gem5, valgrind and simpoint (behavior selected by the name)
+fake_exe = '''#!%(python)s
+import os, random, sys, time
+name = os.path.basename(sys.argv[0])
+opts = dict(a.lstrip("-").split("=", 1) for a in sys.argv[1:] if "=" in a)
+# Fill the log, touch the memory and take the time of a real execution
+line = "info: simulating the stand-in workload\\n"
+sys.stdout.write((line * (%(log)d // len(line) + 1))[:%(log)d])
+mem = bytearray(%(mem)d)
+for i in range(0, len(mem), 4096):
+    mem[i] = 1
+time.sleep(%(runtime)f)
+if random.random() < %(fail)f:
+    print(random.choice(["fatal: Out of memory", "fatal: syscall unknown",
+        "panic: Page table fault"]))
+    sys.exit(1)
+if name.startswith("gem5"):
+    print("Resuming from SimPoint\\nDone running SimPoint!")
+    with open(os.path.join(opts.get("outdir", "."), "stats.txt"), "w") as f:
+        f.write("sim_seconds 0.001\\nsimInsts 1000000\\n")
+elif name == "valgrind":
+    for p, line in (("bb-out-file", "T:1:1000 :2:500\\n"),
+                    ("pc-out-file", ""), ("massif-out-file", "")):
+        if p in opts:
+            with open(opts[p], "w") as f:
+                f.write(line)
+elif name == "simpoint":
+    args = sys.argv[1:]
+    for p, line in (("-saveSimpoints", "0 0\\n"),
+                    ("-saveSimpointWeights", "1.0 0\\n")):
+        with open(args[args.index(p) + 1], "w") as f:
+            f.write(line)
+'''
+
+
+def log(string):
+    print("[selfbench] %s" % string)
+    sys.stdout.flush()
+
+
+# Write the stand-in executable with the given behavior
+def write_fake(path, args):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), mode=0o755)
+    with open(path, "w") as out:
+        out.write(fake_exe % {"python": sys.executable,
+            "log": sizenum(args.log_size), "mem": sizenum(args.memory),
+            "runtime": args.runtime, "fail": args.fail})
+    os.chmod(path, 0o755)
+    return
+
+
+# Build a synthetic SPEC tree, data folder and gem5/simpoint/valgrind folders
+# with the given number of checkpoints per workload
+def make_tree(root, benchmarks, cpts, args):
+    spec_dir = os.path.join(root, "spec")
+    data_dir = os.path.join(root, "data", "x86-64")
+    for b_name in benchmarks:
+        b_folder = os.path.join(spec_dir, b_name)
+        os.makedirs(os.path.join(b_folder, "exe"))
+        exe_name = bench5.benchlist.exe_name.get(b_name,
+            b_name.split('.')[1]) + "_base.x86-64"
+        open(os.path.join(b_folder, "exe", exe_name), "w").close()
+        in_folder = os.path.join(b_folder, "data", "test", "input")
+        os.makedirs(in_folder)
+        for i in range(args.inputs):
+            with open(os.path.join(in_folder, "input_%d" % i), "w") as f:
+                f.write("0" * 1024)
+        for subset in bench5.get_ss_params(b_name, "test"):
+            if subset[2]:
+                # Standard input of the workload
+                with open(os.path.join(in_folder, subset[2]), "w") as f:
+                    f.write("0" * 1024)
+            cpt_dir = os.path.join(data_dir, b_name, "checkpoint", subset[0])
+            os.makedirs(cpt_dir)
+            for i in range(cpts):
+                os.mkdir(os.path.join(cpt_dir, "cpt.simpoint_%02d_inst_%d_" % (
+                    i, i * 1000) + "weight_%f_interval_1000_warmup_0" % (
+                    1. / cpts)))
+    write_fake(os.path.join(root, "gem5", "build", "X86", "gem5.fast"), args)
+    se_dir = os.path.join(root, "gem5", "configs", "example")
+    os.makedirs(se_dir)
+    open(os.path.join(se_dir, "se.py"), "w").close()
+    write_fake(os.path.join(root, "simpoint", "bin", "simpoint"), args)
+    write_fake(os.path.join(root, "bin", "valgrind"), args)
+    return
+
+
+# Path of a log file, also if the folder of its job has been renamed after a
+# failure (err_<cause>_<folder>)
+def find_log(log_path):
+    folder, name = os.path.split(log_path)
+    head, tail = os.path.split(folder)
+    for path in [log_path] + glob.glob(os.path.join(head, "err_*_" + tail,
+                                                    name)):
+        if find_any(path):
+            return path
+    return None
+
+
+# Measure the orchestration phases for a campaign of about size jobs
+def run_size(root, benchmarks, workloads, size, args):
+    out_dir = os.path.join(root, "out")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    cpts = int(math.ceil(float(size) / workloads))
+    b5_args = bench5.build_parser().parse_args(["test"] + benchmarks + [
+        "-x", "--arch", "x86-64", "--cpts", str(cpts),
+        "--spec-dir", os.path.join(root, "spec"),
+        "--gem5-dir", os.path.join(root, "gem5"),
+        "--data-dir", os.path.join(root, "data"),
+        "--out-dir", out_dir, "--max-proc", str(args.max_proc)])
+    exe = os.path.join(root, "gem5", "build", "X86", "gem5.fast")
+    result = {"size": size}
+
+    # Planning only (checkpoint discovery, parameters, commands)
+    simpoints._cache.clear()
+    b5_args.dry = True
+    rss = get_rss(os.getpid())
+    start = time.time()
+    spawn_list = bench5.detailed_sim(CptSimulation, exe, "cpt_sim", b5_args)
+    result["jobs"] = len(spawn_list)
+    result["plan"] = time.time() - start
+    result["plan_mem"] = get_rss(os.getpid()) - rss
+    start = time.time()
+    for s in spawn_list:
+        s.argv()
+    result["argv"] = time.time() - start
+    del spawn_list
+
+    # Planning and preparation of the folders
+    simpoints._cache.clear()
+    b5_args.dry = False
+    start = time.time()
+    spawn_list = bench5.detailed_sim(CptSimulation, exe, "cpt_sim", b5_args)
+    result["prepare"] = time.time() - start - result["plan"]
+
+    # Execution of the first jobs with the stand-in simulator
+    exec_list = spawn_list[:args.exec_jobs]
+    bench5.manifest = RunManifest("selfbench", b5_args)
+    bench5.execute(exec_list, b5_args, threading.Semaphore(args.max_proc),
+        "cpt_sim")
+    op = bench5.manifest.lastOp()
+    first = min(j["start"] for j in op["jobs"])
+    result["spawn_rate"] = len(op["jobs"]) / (op["end"] - op["start"])
+    result["first_spawn"] = (result["plan"] + result["prepare"] +
+        first - op["start"])
+    result["failed"] = len(bench5.sp_fail)
+
+    # Log classification (of the logs still present)
+    log_paths = [p for p in (find_log(s.log_path) for s in exec_list) if p]
+    start = time.time()
+    for p in log_paths:
+        bench5.classify_log(p)
+    result["classify"] = ((time.time() - start) / len(log_paths)
+        if log_paths else 0.)
+
+    bench5.sp_fail.clear()
+    bench5.count_pids = bench5.count_term = bench5.count_retry = 0
+    bench5.count_skip = 0
+    bench5.warnings = []
+    return result
+
+
+# Measure the orchestration phases of the modes run with valgrind and
+# simpoint (one job per workload), the second using the output of the first
+def run_simple(root, benchmarks, args):
+    out_dir = os.path.join(root, "out_simple")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    b5_args = bench5.build_parser().parse_args(["test"] + benchmarks + [
+        "-x", "--arch", "x86-64",
+        "--spec-dir", os.path.join(root, "spec"),
+        "--gem5-dir", os.path.join(root, "gem5"),
+        "--sp-dir", os.path.join(root, "simpoint"),
+        "--data-dir", os.path.join(root, "data"),
+        "--out-dir", out_dir, "--max-proc", str(args.max_proc)])
+    exes = {
+        "bbv_gen" : os.path.join(root, "bin", "valgrind"),
+        "sp_gen"  : os.path.join(root, "simpoint", "bin", "simpoint")
+    }
+    results = []
+    for mode in ("bbv_gen", "sp_gen"):
+        sim_class = bench5.get_sim_info(mode)[0]
+        result = {"mode": mode}
+
+        # Planning only
+        b5_args.dry = True
+        start = time.time()
+        spawn_list = bench5.simple_sim(sim_class, exes[mode], mode, b5_args)
+        result["jobs"] = len(spawn_list)
+        result["plan"] = time.time() - start
+
+        # Planning and preparation of the folders
+        b5_args.dry = False
+        start = time.time()
+        spawn_list = bench5.simple_sim(sim_class, exes[mode], mode, b5_args)
+        result["prepare"] = time.time() - start - result["plan"]
+
+        # Execution of the first jobs with the stand-in tools
+        exec_list = spawn_list[:args.exec_jobs]
+        result["spawn_rate"], result["first_spawn"] = 0., 0.
+        if exec_list:
+            bench5.manifest = RunManifest("selfbench", b5_args)
+            bench5.execute(exec_list, b5_args,
+                threading.Semaphore(args.max_proc), mode)
+            op = bench5.manifest.lastOp()
+            first = min(j["start"] for j in op["jobs"])
+            result["spawn_rate"] = len(op["jobs"]) / (op["end"] - op["start"])
+            result["first_spawn"] = (result["plan"] + result["prepare"] +
+                first - op["start"])
+        result["failed"] = len(bench5.sp_fail)
+        results.append(result)
+
+        # The next mode reads the output of this one
+        b5_args.data_dir = out_dir
+        bench5.sp_fail.clear()
+        bench5.count_pids = bench5.count_term = bench5.count_retry = 0
+        bench5.count_skip = 0
+        bench5.warnings = []
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of " +
+        "bench5 with a stand-in simulator")
+    parser.add_argument("sizes", nargs="*", type=int,
+        default=[100, 10000, 100000], help="approximate number of jobs of " +
+        "each campaign (default: 100 10000 100000)")
+    parser.add_argument("--exec-jobs", action="store", type=int, metavar="N",
+        default=20, help="number of jobs actually executed for each size " +
+        "(default: %(default)s)")
+    parser.add_argument("--max-proc", action="store", type=int, metavar="N",
+        default=4, help="number of processes that can run concurrently " +
+        "(default: %(default)s)")
+    parser.add_argument("--runtime", action="store", type=float,
+        metavar="SECONDS", default=0., help="runtime of the stand-in " +
+        "simulator (default: %(default)s)")
+    parser.add_argument("--memory", action="store", type=str, metavar="SIZE",
+        default="0B", help="memory touched by the stand-in simulator " +
+        "(default: %(default)s)")
+    parser.add_argument("--fail", action="store", type=float, metavar="P",
+        default=0., help="failure probability of the stand-in simulator " +
+        "(default: %(default)s)")
+    parser.add_argument("--spawn-interval", action="store", type=float,
+        metavar="SECONDS", default=0., help="rate limiting of the spawns, " +
+        "which bounds the spawn rate (default: %(default)s, bench5 uses " +
+        "%s)" % bench5.spawn_interval)
+    parser.add_argument("--log-size", action="store", type=str,
+        metavar="SIZE", default="64KB", help="log written by the stand-in " +
+        "simulator (default: %(default)s)")
+    parser.add_argument("--inputs", action="store", type=int, metavar="N",
+        default=4, help="input files of each benchmark " +
+        "(default: %(default)s)")
+    parser.add_argument("--work-dir", action="store", type=bench5.path,
+        metavar="DIR", help="folder for the synthetic tree (default: a new " +
+        "temporary folder)")
+    parser.add_argument("--keep", action="store_true",
+        help="do not remove the synthetic tree at the end")
+    parser.add_argument("--json", action="store", type=str, metavar="FILE",
+        help="also write the results to FILE")
+    args = parser.parse_args()
+
+    bench5.catalog = benchsuites.load("spec2017")
+    bench5.benchlist = bench5.catalog.module
+    bench5.benchsuite = "spec2017"
+    bench5.spawn_interval = args.spawn_interval
+    # Rate benchmarks (no preprocessing needed)
+    benchmarks = list(bench5.catalog.resolve("all_rate"))
+
+    root = tempfile.mkdtemp(prefix="selfbench_", dir=args.work_dir)
+    results = []
+    try:
+        log("building the synthetic tree in %s" % root)
+        workloads = 0
+        for b_name in benchmarks:
+            workloads += len(bench5.get_ss_params(b_name, "test"))
+        make_tree(root, benchmarks,
+            int(math.ceil(float(max(args.sizes)) / workloads)), args)
+        for size in args.sizes:
+            log("campaign of %d jobs" % size)
+            results.append(run_size(root, benchmarks, workloads, size, args))
+        # The stand-in valgrind must be found in the PATH
+        os.environ["PATH"] = (os.path.join(root, "bin") + os.pathsep +
+            os.environ["PATH"])
+        log("bbv and simpoint generation")
+        simple = run_simple(root, benchmarks, args)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print("")
+    # Times in seconds, except for the classification (per job)
+    log("%8s %9s %9s %9s %9s %9s %9s %9s %9s %6s" % ("jobs", "plan",
+        "plan/s", "plan mem", "argv", "prepare", "spawn/s", "1st spawn",
+        "classify", "failed"))
+    for r in results:
+        log("%8d %9.2f %9d %8dM %9.2f %9.2f %9.2f %9.2f %7.2fms %6d" % (
+            r["jobs"], r["plan"], r["jobs"] / max(r["plan"], 1e-6),
+            r["plan_mem"] // 2**20, r["argv"], r["prepare"],
+            r["spawn_rate"], r["first_spawn"], r["classify"] * 1000,
+            r["failed"]))
+    log("%8s %8s %9s %9s %9s %9s %6s" % ("mode", "jobs", "plan",
+        "prepare", "spawn/s", "1st spawn", "failed"))
+    for r in simple:
+        log("%8s %8d %9.2f %9.2f %9.2f %9.2f %6d" % (r["mode"], r["jobs"],
+            r["plan"], r["prepare"], r["spawn_rate"], r["first_spawn"],
+            r["failed"]))
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results + simple, out, indent=1, sort_keys=True)
+    return
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,19 @@ __email__  = "tommarin@ucm.es"
 
 import gzip
 import errno
+from functools import reduce
+import itertools
 import os
 import re
 import shutil
 import sys
 # Local modules
+from bbv import coarsen_bbv
+from jobs import Command, get_template
+from postproc import find_any
+from simpoints import default_dim, default_seed, load_checkpoints, \
+    load_simpoints, simpoint_grid
+from staging import Stage
 import simparams
 
 python_version = sys.version_info[:2]
@@ -39,16 +47,38 @@ def force_symlink(orig, dest):
     return
 
 # Create a clone of the origin folder with symlinks to all the files
-def mirror_dir(orig, dest):
+# (or to the same files in the link_orig folder, if given)
+def mirror_dir(orig, dest, link_orig=None):
     for root, dirs, files in os.walk(orig):
         subroot = root.split(orig + "/")[1] if root != orig else ""
         for name in dirs:
             os.mkdir(os.path.join(dest, subroot, name), 0o755)
         for name in files:
-            force_symlink(os.path.join(root, name),
+            force_symlink(os.path.join(link_orig or orig, subroot, name),
                 os.path.join(dest, subroot, name))
     return
 
+# Get the folders of a benchmark in the SPEC tree
+# Tuple: (executables folder, list of input folders, which may not exist)
+def bench_folders(spec_dir, benchsuite, b_name, b_set):
+    spec_b_folder = os.path.join(spec_dir, b_name)
+    exe_folder = os.path.join(spec_b_folder, "exe")
+    if benchsuite == "spec2017":
+        # If there's no data folder check in the rate benchmark folder
+        if not os.path.isdir(os.path.join(spec_b_folder, "data")):
+            rate_b_name = "5" + b_name[1:len(b_name)-1] + "r"
+            spec_b_folder = os.path.join(spec_dir, rate_b_name)
+        if b_set == "ref":
+            if "_s" in b_name:
+                # If there's no refspeed folder try with refrate
+                b_set = ("refspeed" if os.path.isdir(os.path.join(
+                    spec_b_folder, "data", "refspeed")) else "refrate")
+            else:
+                b_set = "refrate"
+    in_folders = [os.path.join(spec_b_folder, "data", b_set, "input"),
+        os.path.join(spec_b_folder, "data", "all", "input")]
+    return exe_folder, in_folders
+
 # Helper function to add a parameter only if the value is valid
 def add_if_valid(struct, param, value):
     if value:
@@ -70,6 +100,7 @@ class Simulation(object):
         self._flags        = []
         self._workloads    = []
         self._params       = {}
+        self._cfg_params   = {}
         self._target_dir   = None
         self._trailing_dir = None
         self._bin_path     = None
@@ -78,12 +109,21 @@ class Simulation(object):
         self._prereq_dir   = None
         self._det_conf     = None
         self._detailed     = False
+        self._multi        = False
         self._env_prep     = False
         return
 
     def isDetailed(self):
         return self._detailed
 
+    """ If true, prepareEnvironment returns a list of paths and generateCommand
+    returns a list of commands (one for each process to spawn) """
+    def isMulti(self):
+        return self._multi
+
+    def getBenchmarks(self):
+        return tuple(w[0] for w in self._workloads)
+
     def setSimPath(self, bin_path):
         if not os.path.isfile(bin_path):
             raise Exception("Simulator executable not found: %s" % bin_path)
@@ -184,8 +224,8 @@ class Simulation(object):
             b_abbr_0, self._workloads[0][2]))
         if len(self._workloads) > 1:
             for w in self._workloads[1:]:
-                b_spl = self._workloads[0][0].split(".")
-                b_abbr = b_spl_0[0] + b_spl_0[1]
+                b_spl = w[0].split(".")
+                b_abbr = b_spl[0] + b_spl[1]
                 self._params["output"] += ";%s" % os.path.join(self._out_path,
                     "%s.%s.out" % (b_abbr, w[2]))
 
@@ -197,6 +237,8 @@ class Simulation(object):
         if self._env_prep:
             raise Exception("The environment has already been prepared")
         if not self._workloads:
+            # Parameters shared by all the workloads of this configuration
+            self._cfg_params = dict(self._params)
             # Single workload
             self._params["cmd"] = "./%s" % b_params[0]
             self._params["mem-size"] = b_params[2]
@@ -239,6 +281,9 @@ class Simulation(object):
         if self._prereq_dir:
             self._data_path = os.path.join(args.data_dir, self._base_sf,
                 self._prereq_dir, self._wl_ss)
+            # Simpoints of a run of a SimPoint grid, if selected
+            if self._prereq_dir == "simpoint" and args.sp_key:
+                self._data_path = os.path.join(self._data_path, args.sp_key)
         # Append workload to the list
         self._workloads.append((b_name, b_params, subset[0]))
         # Set/update output parameter
@@ -257,32 +302,23 @@ class Simulation(object):
             shutil.rmtree(tmp_path)
         # Create the temporary folder and consequently the output folder
         os.makedirs(tmp_path, mode=0o755)
+        # Link to the node-local copy of the SPEC tree, if any
+        stage = (Stage(args.spec_dir, args.stage_dir) if args.stage_dir
+            else None)
         for w in self._workloads:
             b_name, b_params = w[:2]
-            spec_b_folder = os.path.join(args.spec_dir, b_name)
+            exe_folder, in_folders = bench_folders(args.spec_dir, benchsuite,
+                b_name, args.set[0])
             # Make a symlink to the executable in the temporary directory
-            b_exe_path = os.path.join(spec_b_folder, "exe", b_params[0])
-            force_symlink(b_exe_path, os.path.join(tmp_path, b_params[0]))
+            b_exe_path = os.path.join(exe_folder, b_params[0])
+            force_symlink(stage.localPath(b_exe_path) if stage
+                else b_exe_path, os.path.join(tmp_path, b_params[0]))
             # Prepare the temporary directory with symlinks to input data
-            b_set = args.set[0]
-            if benchsuite == "spec2017":
-                # If there's no data folder check in the rate benchmark folder
-                if not os.path.isdir(os.path.join(spec_b_folder, "data")):
-                    rate_b_name = "5" + b_name[1:len(b_name)-1] + "r"
-                    spec_b_folder = os.path.join(args.spec_dir, rate_b_name)
-                if b_set == "ref":
-                    if "_s" in b_name:
-                        # If there's no refspeed folder try with refrate
-                        b_set = ("refspeed" if os.path.isdir(os.path.join(
-                            spec_b_folder, "data", "refspeed")) else "refrate")
-                    else:
-                        b_set = "refrate"
-            in_folders = [os.path.join(spec_b_folder, "data", b_set, "input"),
-                os.path.join(spec_b_folder, "data", "all", "input")]
             for d in in_folders:
                 # Any invalid path will be ignored
                 if os.path.isdir(d):
-                    mirror_dir(d, tmp_path)
+                    mirror_dir(d, tmp_path,
+                        stage.localPath(d) if stage else None)
             # Do preprocessing of input data if necessary
             if b_params[1] != None:
                 proc = subprocess.Popen(b_params[1], shell=True, cwd=tmp_path)
@@ -316,19 +352,20 @@ class Simulation(object):
                 "example", "se.py")
         if not os.path.isfile(self._cfg_path):
             raise Exception("Config file does not exist: %s" % self._cfg_path)
-        # Generate the command
-        command = "%s --outdir=%s " % (self._bin_path, self._out_path)
+        # The parameters set before adding the workloads go in the shared
+        # template, everything else (or overridden since) in the job delta
+        exe_opts = [self._bin_path]
         if self._debug_flags:
-            command += "--debug-flags="
-            for i, d in enumerate(self._debug_flags):
-                command += "%s" % d
-                command += ("," if i != len(self._debug_flags) - 1 else " ")
-        command += "%s " % self._cfg_path
-        for f in sorted(self._flags):
-            command += "--%s " % f
-        for p in sorted(self._params):
-            command += "--%s=\"%s\" " % (p, str(self._params[p]))
-        return command
+            exe_opts.append("--debug-flags=%s" % ",".join(self._debug_flags))
+        shared, delta = {}, {}
+        for p, v in self._params.items():
+            if p in self._cfg_params and self._cfg_params[p] == v:
+                shared[p] = v
+            else:
+                delta[p] = str(v)
+        template = get_template(exe_opts, self._cfg_path,
+            sorted(self._flags), shared)
+        return Command(template, self._out_path, delta)
 
 
 """ Some other applications than the gem5 simulator may need to
@@ -364,6 +401,11 @@ class BBVGeneration(Simulation):
         self._flags.append("simpoint-profile")
         self._params["simpoint-interval"] = args.int_size
         self._target_dir = "bbv"
+        # Profile at a finer interval size, from which the BBVs of any
+        # multiple of it can be derived later (see SPGeneration)
+        if args.bbv_base:
+            self._params["simpoint-interval"] = args.bbv_base
+            self._trailing_dir = "int_%d" % args.bbv_base
         return
 
     def addWorkload(self, b_name, b_params, subset, args):
@@ -386,6 +428,14 @@ class SPGeneration(DummySimulation):
         super(SPGeneration, self).__init__(args)
         self._target_dir = "simpoint"
         self._prereq_dir = "bbv"
+        # Grid of SimPoint parameters, if requested: one run for each
+        # combination, with the results in a parameter-keyed subfolder
+        self._grid = []
+        if args.sp_maxk or args.sp_dim or args.sp_seed:
+            self._grid = simpoint_grid(args.sp_maxk or [args.maxk],
+                args.sp_dim or [default_dim], args.sp_seed or [default_seed])
+        self._multi  = bool(self._grid)
+        self._cached = 0
         return
 
     def addWorkload(self, b_name, b_params, subset, args):
@@ -406,21 +456,87 @@ class SPGeneration(DummySimulation):
         else:
             bbv_filename = "simpoint.bb.gz"
         bbv_filepath = os.path.join(self._data_path, bbv_filename)
-        assert os.path.isfile(bbv_filepath), "missing file %s" % bbv_filepath
-        # Check if the BBVs file contains any interval
-        if not args.use_gem5:
-            rgx = subprocess.check_output("sed '/^[[:blank:]]*#/d;s/#.*//' " +
-                bbv_filepath + " | wc -w", shell=True)
-            result = int(rgx)
+        if args.bbv_base:
+            # Derive the BBVs from the ones profiled at the base interval
+            bbv_filepath = self._deriveBBV(bbv_filename, args)
         else:
-            with gzip.open(bbv_filepath, 'rb') as f:
-                data = f.read(1)
-            result = len(data)
-        assert result != 0, "%s does not contain any interval" % bbv_filename
-        tmp_path, log_path = super(
-            SPGeneration, self).prepareEnvironment(benchsuite, args)
+            assert os.path.isfile(bbv_filepath), "missing file %s" % (
+                bbv_filepath)
+            # Check if the BBVs file contains any interval
+            if not args.use_gem5:
+                rgx = subprocess.check_output(
+                    "sed '/^[[:blank:]]*#/d;s/#.*//' " + bbv_filepath +
+                    " | wc -w", shell=True)
+                result = int(rgx)
+            else:
+                with gzip.open(bbv_filepath, 'rb') as f:
+                    data = f.read(1)
+                result = len(data)
+            assert result != 0, "%s does not contain any interval" % (
+                bbv_filename)
         self._bbv_filepath = bbv_filepath
-        return tmp_path, log_path
+        if self._multi:
+            return self._prepareGrid(benchsuite, args)
+        return super(SPGeneration, self).prepareEnvironment(benchsuite, args)
+
+    # Sum the intervals of the BBVs profiled at the base interval size into
+    # BBVs of the same format at the target size, in the output folder
+    # (unless already derived from the same profile)
+    # Return the path of the derived BBVs
+    def _deriveBBV(self, bbv_filename, args):
+        base_filepath = os.path.join(self._data_path, "int_%d" %
+            args.bbv_base, bbv_filename)
+        assert os.path.isfile(base_filepath), "missing file %s" % (
+            base_filepath)
+        bbv_filepath = os.path.join(self._out_path, "%s.int_%d" % (
+            bbv_filename.replace(".gz", ""), args.int_size) +
+            (".gz" if args.use_gem5 else ""))
+        if args.dry:
+            return bbv_filepath
+        if not os.path.isdir(self._out_path):
+            os.makedirs(self._out_path, mode=0o755)
+        if not (os.path.isfile(bbv_filepath) and
+            os.path.getmtime(bbv_filepath) >= os.path.getmtime(base_filepath)):
+            count = coarsen_bbv(base_filepath, bbv_filepath,
+                args.int_size // args.bbv_base)
+            assert count != 0, "%s does not contain any interval of %d " % (
+                base_filepath, args.int_size) + "instructions"
+        return bbv_filepath
+
+    # Whether the results in a folder have been computed from the current
+    # BBVs (the simpoints and their weights exist and are not older)
+    def _isCached(self, path):
+        if not os.path.isfile(self._bbv_filepath):
+            return False
+        bbv_mtime = os.path.getmtime(self._bbv_filepath)
+        for name in ("simpoint_%s" % self._wl_ss, "weight_%s" % self._wl_ss):
+            f = os.path.join(path, name)
+            if (not os.path.isfile(f) or not os.path.getsize(f) or
+                os.path.getmtime(f) < bbv_mtime):
+                return False
+        return True
+
+    # Prepare a folder for each combination of parameters of the grid,
+    # except the ones already computed from the same BBVs
+    # List of tuples: (temporary folder, log file path, grid point)
+    def _prepareGrid(self, benchsuite, args):
+        paths = []
+        self._cached = 0
+        for point in self._grid:
+            key_path = os.path.join(self._out_path, point[0])
+            if self._isCached(key_path):
+                self._cached += 1
+                continue
+            tmp_path = super(SPGeneration, self)._prepareFolder(key_path,
+                benchsuite, args)
+            paths.append((tmp_path, os.path.join(key_path, "log_%s" %
+                self._wl_ss), point))
+        self._env_prep = True
+        return paths
+
+    # Number of runs of the grid skipped, already computed
+    def cached(self):
+        return self._cached
 
     def getBBVFilePath(self):
         if not self._env_prep:
@@ -452,6 +568,8 @@ class CptGeneration(Simulation):
         wgt_fname = "weight_%s" % self._wl_ss
         sp_fpath  = os.path.join(self._data_path, sp_fname)
         wgt_fpath = os.path.join(self._data_path, wgt_fname)
+        # Check the simpoints, which gem5 needs as plain files
+        load_simpoints(self._data_path, self._wl_ss)
         assert os.path.isfile(sp_fpath),  "missing file %s" % sp_fpath
         assert os.path.isfile(wgt_fpath), "missing file %s" % wgt_fpath
         tmp_path, log_path = super(
@@ -466,24 +584,82 @@ class CptSimulation(Simulation):
     def __init__(self, args):
         super(CptSimulation, self).__init__(args)
         self._detailed = True
+        self._multi = True
         self._target_dir = "simulation"
         self._prereq_dir = "checkpoint"
+        self._cpt_paths  = []
         return
 
+    def addWorkload(self, b_name, b_params, subset, args):
+        super(CptSimulation, self).addWorkload(b_name, b_params, subset, args)
+        # Each workload is restored from its own checkpoints
+        self._cpt_paths.append(os.path.join(args.data_dir, args.arch, b_name,
+            self._prereq_dir, subset[0]))
+        self._data_path = ";".join(self._cpt_paths)
+        return
+
+    # Multi-programmed simulation from the checkpoints of each workload: the
+    # simpoints are paired by rank of weight (the heaviest ones together,
+    # cycling over the workloads with less simpoints, so that none of them
+    # is dropped) or in all the combinations (cross), each combination
+    # weighted by the product of the simpoint weights, normalized. Each core
+    # is restored from its own checkpoint, and the simulation ends when any
+    # of them reaches the instruction bound (by default interval size plus
+    # warmup)
+    def _prepareMix(self, benchsuite, args):
+        selected, positions = [], []
+        for path in self._cpt_paths:
+            assert os.path.isdir(path), "missing folder %s" % path
+            simpoints, cpt_folders = load_checkpoints(path)
+            assert len(simpoints), "missing checkpoints in %s" % path
+            # gem5 restores checkpoints by position in the sorted folder list
+            cpt_pos = dict((d, i) for i, d in
+                enumerate(sorted(cpt_folders.values()), 1))
+            positions.append(dict((idx, cpt_pos[d])
+                for idx, d in cpt_folders.items()))
+            selected.append(simpoints.top(args.cpts) if args.cpts
+                else simpoints.sorted())
+        if args.mp_pairing == "cross":
+            combos = list(itertools.product(*selected))
+        else:
+            combos = [tuple(sps[i % len(sps)] for sps in selected)
+                for i in range(max(len(sps) for sps in selected))]
+        weights = [reduce(lambda w, sp: w * sp[2], combo, 1.)
+            for combo in combos]
+        total = sum(weights)
+        cpt_paths = []
+        self.cpt_info = []
+        for i, combo in enumerate(combos):
+            cpt_out_path = os.path.join(self._out_path,
+                "cpt.mix_%02d_weight_%.6e" % (i, weights[i] / total))
+            cpt_log_path = os.path.join(cpt_out_path, "%s.log" % self._wl_id)
+            cpt_tmp_path = super(CptSimulation, self)._prepareFolder(
+                cpt_out_path, benchsuite, args)
+            cpt_paths.append((cpt_tmp_path, cpt_log_path))
+            self.cpt_info.append((";".join(str(positions[w][sp[0]])
+                for w, sp in enumerate(combo)), cpt_out_path))
+        self._flags.append("restore-simpoint-checkpoint")
+        self._params["checkpoint-dir"] = self._data_path
+        self._params["maxinsts"] = (args.mp_insts if args.mp_insts
+            else args.int_size + args.warmup)
+        self._env_prep = True
+        return cpt_paths
+
     def prepareEnvironment(self, benchsuite, args):
         if not self._workloads:
             raise Exception("No workload has been set")
+        if len(self._workloads) > 1:
+            return self._prepareMix(benchsuite, args)
         assert os.path.isdir(self._data_path), "missing folder %s" % (
             self._data_path)
-        cpt_prefix = "cpt.simpoint_"
-        cpt_folders = sorted([d for d in os.listdir(self._data_path)
-            if cpt_prefix in d])
-        assert any(cpt_folders), "missing checkpoints in %s" % self._data_path
-        cpt_indexed = zip(range(1, len(cpt_folders) + 1), cpt_folders)
-        cpt_sorted  = sorted(cpt_indexed,
-            key=lambda x: float(x[1].split('_')[5]), reverse=True)
-        if args.cpts and args.cpts < len(cpt_sorted):
-            cpt_sorted = cpt_sorted[:args.cpts]
+        simpoints, cpt_folders = load_checkpoints(self._data_path)
+        assert len(simpoints), "missing checkpoints in %s" % self._data_path
+        # gem5 restores checkpoints by position in the sorted folder list
+        cpt_pos = dict((d, i) for i, d in
+            enumerate(sorted(cpt_folders.values()), 1))
+        cpt_sorted = [(cpt_pos[cpt_folders[sp[0]]], cpt_folders[sp[0]])
+            for sp in (simpoints.top(args.cpts) if args.cpts
+                       else simpoints.sorted())]
         cpt_paths = []
         self.cpt_info = []
         for idx, cpt in cpt_sorted:
@@ -518,6 +694,31 @@ class FullSimulation(Simulation):
         return
 
 
+""" Periodic sampling (SMARTS): the simulation alternates functional
+fast-forward and detailed windows, each one preceded by a detailed warmup,
+at a fixed period of instructions. The config script dumps and resets the
+statistics at the end of each measured window, so that the confidence
+interval of the CPI can be followed while the simulation runs (see
+sampling.py) and the simulation can be stopped once it is narrow enough. """
+class SampledSimulation(Simulation):
+    def __init__(self, args):
+        super(SampledSimulation, self).__init__(args)
+        self._detailed = True
+        self._params["smarts-period"] = args.smp_period
+        self._params["smarts-window"] = args.smp_window
+        self._params["smarts-warmup"] = args.smp_warmup
+        self._target_dir   = "simulation"
+        self._trailing_dir = "sampled"
+        return
+
+    def setDetailedParams(self, model, tech, case, args):
+        super(SampledSimulation, self).setDetailedParams(model, tech, case,
+            args)
+        self._cfg_path = os.path.join(args.gem5_dir, "configs", "example",
+            args.smp_cfg)
+        return
+
+
 # gem5 elastic trace generation class
 class TraceGeneration(Simulation):
     def __init__(self, args):
@@ -537,6 +738,8 @@ class TraceGeneration(Simulation):
         self._target_dir = "trace"
         if not args.trace_nohint:
             self._prereq_dir = "simpoint"
+            # Generate a trace for each one of the most relevant simpoints
+            self._multi = args.trace_sps > 1 or bool(args.trace_cov)
         return
 
     # Tech and case arguments are just ignored
@@ -554,40 +757,53 @@ class TraceGeneration(Simulation):
         if self._prereq_dir:
             assert os.path.isdir(self._data_path), "missing folder %s" % (
                 self._data_path)
-            sp_fname  = "simpoint_%s" % self._wl_ss
-            wgt_fname = "weight_%s" % self._wl_ss
-            sp_fpath  = os.path.join(self._data_path, sp_fname)
-            wgt_fpath = os.path.join(self._data_path, wgt_fname)
-            assert os.path.isfile(sp_fpath),  "missing file %s" % sp_fpath
-            assert os.path.isfile(wgt_fpath), "missing file %s" % wgt_fpath
+            simpoints = load_simpoints(self._data_path, self._wl_ss)
             # WARNING: should be read from file, for now assume it is the same
             int_size = args.int_size
-            weights = {}
-            with open(wgt_fpath, 'r') as wgt_file:
-                for l in wgt_file:
-                    value, idx = l.split()
-                    weights[idx] = value
-            # Get the index of the most relevant checkpoint
-            sp_index = max(weights, key=weights.get)
-            sp_bbv = None
-            with open(sp_fpath, 'r') as sp_file:
-                for l in sp_file:
-                    value, idx = l.split()
-                    if idx == sp_index:
-                        sp_bbv = int(value)
-                        break
-            if not sp_bbv:
-                raise Exception("Unexpected error: invalid simpoint index")
-            offset = int(args.trace_insts / 2)
-            ff_point = sp_bbv * int_size - offset
-            # Check if enough instructions would be skipped (for warmup)
-            if ff_point < args.trace_skip:
-                # Revert to fixed value
-                ff_point = args.trace_skip
+            # Get the most relevant simpoints
+            if not self._multi:
+                selected = simpoints.top(1)
+            elif args.trace_cov:
+                selected = simpoints.coverage(args.trace_cov)
+            else:
+                selected = simpoints.top(args.trace_sps)
+            self._sp_info = []
+            for idx, interval, weight in selected:
+                offset = int(args.trace_insts / 2)
+                ff_point = interval * int_size - offset
+                # Check if enough instructions would be skipped (for warmup)
+                if ff_point < args.trace_skip:
+                    # Revert to fixed value
+                    ff_point = args.trace_skip
+                self._sp_info.append((idx, weight, ff_point))
+            self._params["fast-forward"] = self._sp_info[0][2]
+        if not self._multi:
+            tmp_path, log_path = super(
+                TraceGeneration, self).prepareEnvironment(benchsuite, args)
+            return tmp_path, log_path
+        # One trace folder for each simpoint
+        sp_paths = []
+        for i, (idx, weight, ff_point) in enumerate(self._sp_info):
+            sp_out_path = os.path.join(self._out_path,
+                "trace.simpoint_%02d_weight_%s" % (idx, weight))
+            sp_log_path = os.path.join(sp_out_path, "%s.log" % self._wl_id)
+            sp_tmp_path = super(TraceGeneration, self)._prepareFolder(
+                sp_out_path, benchsuite, args)
+            sp_paths.append((sp_tmp_path, sp_log_path))
+            self._sp_info[i] = (idx, weight, ff_point, sp_out_path)
+        self._env_prep = True
+        return sp_paths
+
+    def generateCommand(self, args):
+        if not self._multi:
+            return super(TraceGeneration, self).generateCommand(args)
+        cmd_list = []
+        for idx, weight, ff_point, path in self._sp_info:
+            self._out_path = path
+            self._setOutputParam()
             self._params["fast-forward"] = ff_point
-        tmp_path, log_path = super(
-            TraceGeneration, self).prepareEnvironment(benchsuite, args)
-        return tmp_path, log_path
+            cmd_list.append(super(TraceGeneration, self).generateCommand(args))
+        return cmd_list
 
 
 # gem5 elastic trace simulation class
@@ -614,6 +830,8 @@ class TraceReplay(Simulation):
         if self._env_prep:
             raise Exception("The environment has already been prepared")
         if not self._workloads:
+            # Parameters shared by all the workloads of this configuration
+            self._cfg_params = dict(self._params)
             # Single workload
             self._params["mem-size"] = \
                 (args.repl_mem if args.repl_mem else b_params[2])
@@ -648,33 +866,59 @@ class TraceReplay(Simulation):
         self._workloads.append((b_name, b_params, subset[0]))
         return
 
-    def prepareEnvironment(self, benchsuite, args):
-        if not self._workloads:
-            raise Exception("No workload has been set")
-        cpu_type = self._det_conf[0][1][0]
-        cpu_o3   = self._det_conf[0][1][4]
-        assert cpu_o3, "%s is not out-of-order" % cpu_type
-        for i, d in enumerate(self._data_path.split(';')):
-            assert os.path.isdir(d), "missing folder %s" % d
+    # Set the trace parameters from the given trace folders
+    def _setTraceParams(self, data_paths, args):
+        for i, d in enumerate(data_paths):
             itrace_fname = "%s.%s" % (args.trace_prefix, "fetchtrace.proto")
             dtrace_fname = "%s.%s" % (args.trace_prefix, "deptrace.proto")
-            itrace_fpath = os.path.join(d, itrace_fname)
-            dtrace_fpath = os.path.join(d, dtrace_fname)
             # If the uncompressed trace is not present try with the gzipped one
-            if not os.path.isfile(itrace_fpath):
-                itrace_fpath = itrace_fpath + ".gz"
-            if not os.path.isfile(dtrace_fpath):
-                dtrace_fpath = dtrace_fpath + ".gz"
-            assert os.path.isfile(itrace_fpath), "missing file %s(.%s)" % (
-                tuple(itrace_fpath.rsplit('.', 1)))
-            assert os.path.isfile(dtrace_fpath), "missing file %s(.%s)" % (
-                tuple(dtrace_fpath.rsplit('.', 1)))
+            # (the only compressed format supported by gem5)
+            itrace_fpath = find_any(os.path.join(d, itrace_fname), ("gzip",))
+            dtrace_fpath = find_any(os.path.join(d, dtrace_fname), ("gzip",))
+            assert itrace_fpath, "missing file %s(.gz)" % os.path.join(d,
+                itrace_fname)
+            assert dtrace_fpath, "missing file %s(.gz)" % os.path.join(d,
+                dtrace_fname)
             if i == 0:
                 self._params["inst-trace-file"] = itrace_fpath
                 self._params["data-trace-file"] = dtrace_fpath
             else:
                 self._params["inst-trace-file"] += ";%s" % itrace_fpath
                 self._params["data-trace-file"] += ";%s" % dtrace_fpath
+        return
+
+    def prepareEnvironment(self, benchsuite, args):
+        if not self._workloads:
+            raise Exception("No workload has been set")
+        cpu_type = self._det_conf[0][1][0]
+        cpu_o3   = self._det_conf[0][1][4]
+        assert cpu_o3, "%s is not out-of-order" % cpu_type
+        data_paths = self._data_path.split(';')
+        for d in data_paths:
+            assert os.path.isdir(d), "missing folder %s" % d
+        # Check if there is a trace for each one of several simpoints
+        sp_folders = sorted([d for d in os.listdir(data_paths[0])
+            if d.startswith("trace.simpoint_")])
+        if sp_folders:
+            assert len(data_paths) == 1, ("multiple simpoint traces not " +
+                "supported with multiple workloads")
+            self._multi = True
+            self._sp_info = []
+            sp_paths = []
+            for sp in sp_folders:
+                sp_out_path = os.path.join(self._out_path, sp)
+                if not os.path.isdir(sp_out_path):
+                    os.makedirs(sp_out_path, mode=0o755)
+                sp_log_path = os.path.join(sp_out_path, "%s.log" % (
+                    self._wl_id))
+                sp_data_path = os.path.join(data_paths[0], sp)
+                # Check that the traces are present
+                self._setTraceParams([sp_data_path], args)
+                sp_paths.append((sp_out_path, sp_log_path))
+                self._sp_info.append((sp_data_path, sp_out_path))
+            self._env_prep = True
+            return sp_paths
+        self._setTraceParams(data_paths, args)
         # No need to really prepare the tmp folder here
         tmp_path = self._out_path
         if not os.path.isdir(tmp_path):
@@ -684,6 +928,16 @@ class TraceReplay(Simulation):
         self._env_prep = True
         return tmp_path, log_path
 
+    def generateCommand(self, args):
+        if not self._multi:
+            return super(TraceReplay, self).generateCommand(args)
+        cmd_list = []
+        for data_path, path in self._sp_info:
+            self._out_path = path
+            self._setTraceParams([data_path], args)
+            cmd_list.append(super(TraceReplay, self).generateCommand(args))
+        return cmd_list
+
 
 # Memory profiling class
 class MemProfile(DummySimulation):
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import os
+import re
+import threading
+
+# Local modules
+from postproc import find_any, open_any
+
+# Loaded simpoint sets, by path, with the modification stamp of the files
+# they were loaded from (see load_simpoints/load_checkpoints)
+_cache = {}
+_lock  = threading.Lock()
+# Parameters of the grid runs of SimPoint, if not given (default projection
+# dimension of SimPoint, fixed seed for both the k-means and the projection)
+default_dim  = 15
+default_seed = 1
+
+
+# Build a grid of SimPoint parameters, identifying each combination with a
+# key (e.g. k30_d15_s1)
+# List of tuples: (key, maxK, projection dimension, seed)
+def simpoint_grid(maxks, dims, seeds):
+    return [("k%d_d%d_s%d" % (k, d, s), k, d, s)
+        for k in maxks for d in dims for s in seeds]
+
+
+""" Set of simulation points of a workload. Each simpoint is identified by its
+cluster index and has an interval (in units of the BBV interval size) and a
+weight. The simpoints are kept sorted by decreasing weight. """
+class SimPoints(object):
+    def __init__(self, points):
+        # List of tuples: (cluster index, interval, weight)
+        self._points = sorted(points, key=lambda p: (-p[2], p[0]))
+        self._by_idx = dict((p[0], p) for p in self._points)
+        return
+
+    def __len__(self):
+        return len(self._points)
+
+    def indexes(self):
+        return [p[0] for p in self._points]
+
+    def interval(self, idx):
+        return self._by_idx[idx][1]
+
+    def weight(self, idx):
+        return self._by_idx[idx][2]
+
+    # All the simpoints, by decreasing weight
+    def sorted(self):
+        return list(self._points)
+
+    # The k simpoints with the largest weight
+    def top(self, k):
+        return self._points[:max(k, 0)]
+
+    # The smallest set of heaviest simpoints whose total weight reaches frac
+    def coverage(self, frac):
+        total = 0.
+        for i, p in enumerate(self._points):
+            total += p[2]
+            if total >= frac:
+                return self._points[:i + 1]
+        return list(self._points)
+
+
+# Modification time and size of some files or folders, to tell whether a
+# cached result is still valid (e.g. rewritten by a previous operation)
+def _stamp(*paths):
+    return tuple((st.st_mtime, st.st_size) for st in map(os.stat, paths))
+
+
+# Get a cached result if its stamp matches, otherwise None
+def _lookup(path, stamp):
+    with _lock:
+        entry = _cache.get(path)
+    if entry is None or entry[0] != stamp:
+        return None
+    return entry[1]
+
+
+# Parse a file with one "<value> <cluster index>" pair per line
+def _parse_pairs(path, conv):
+    pairs = {}
+    with open_any(path) as pairs_file:
+        for l in pairs_file:
+            fields = l.split()
+            if len(fields) == 2:
+                pairs[int(fields[1])] = conv(fields[0])
+    return pairs
+
+
+# Load the simpoints of a subset from the simpoint_<subset> and
+# weight_<subset> files in a data folder (parsed again only if modified)
+def load_simpoints(data_path, subset):
+    sp_fpath  = os.path.join(data_path, "simpoint_%s" % subset)
+    wgt_fpath = os.path.join(data_path, "weight_%s" % subset)
+    sp_found, wgt_found = find_any(sp_fpath), find_any(wgt_fpath)
+    assert sp_found,  "missing file %s" % sp_fpath
+    assert wgt_found, "missing file %s" % wgt_fpath
+    stamp = _stamp(sp_found, wgt_found)
+    simpoints = _lookup(sp_fpath, stamp)
+    if simpoints is not None:
+        return simpoints
+    intervals = _parse_pairs(sp_fpath, int)
+    weights   = _parse_pairs(wgt_fpath, float)
+    assert intervals, "%s does not contain any simpoint" % sp_fpath
+    assert set(intervals) == set(weights), "simpoint mismatch in %s" % (
+        data_path)
+    simpoints = SimPoints([(idx, intervals[idx], weights[idx])
+        for idx in intervals])
+    with _lock:
+        _cache[sp_fpath] = (stamp, simpoints)
+    return simpoints
+
+
+# Load the simpoints from the checkpoint folders created by gem5
+# (cpt.simpoint_<idx>_inst_<n>_weight_<w>_interval_<len>_warmup_<n>), listed
+# again only if folders have been added or removed
+# Tuple: (simpoints set, dict of checkpoint folders by cluster index)
+def load_checkpoints(cpt_path):
+    stamp = _stamp(cpt_path)
+    simpoints = _lookup(cpt_path, stamp)
+    if simpoints is not None:
+        return simpoints
+    folders, points = {}, []
+    rgx = re.compile(r'^cpt\.simpoint_(\d+)_inst_(\d+)_weight_([^_]+)' +
+                     r'_interval_(\d+)_warmup_(\d+)')
+    for d in os.listdir(cpt_path):
+        match = rgx.match(d)
+        if match:
+            idx, inst, weight, length, warmup = match.groups()
+            # The starting instruction includes the warmup period
+            interval = (int(inst) + int(warmup)) // int(length)
+            points.append((int(idx), interval, float(weight)))
+            folders[int(idx)] = d
+    simpoints = (SimPoints(points), folders)
+    with _lock:
+        _cache[cpt_path] = (stamp, simpoints)
+    return simpoints
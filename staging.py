@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import errno
+import fcntl
+import os
+import shutil
+import threading
+
+
+""" Node-local copy of the benchmark folders (executables and input data) of
+the SPEC tree, so that the processes starting together do not all read the
+same files from a shared filesystem. The copy mirrors the layout of the SPEC
+tree under the stage folder, which must be the same local path on every host
+executing the jobs, since the job folders link to it. Files are copied only
+if missing, or if their size or modification time differ from the original,
+so syncing an up-to-date copy is cheap. The copy can be shared by several
+processes on the same host (e.g. shards of a plan): each one registers
+itself with acquire, and release removes the copy only when the last user
+leaves (users which died without releasing it are ignored). """
+class Stage(object):
+    def __init__(self, spec_dir, stage_dir):
+        self._spec_dir  = spec_dir
+        self._stage_dir = stage_dir
+        self._lock      = threading.Lock()
+        return
+
+    def getPath(self):
+        return self._stage_dir
+
+    # Path of the local copy of a file or folder of the SPEC tree
+    def localPath(self, path):
+        return os.path.join(self._stage_dir,
+            os.path.relpath(path, self._spec_dir))
+
+    # Copy a file unless the local copy is up to date
+    # Return the number of bytes copied, or None if up to date
+    def _syncFile(self, src, dest):
+        src_st = os.stat(src)
+        try:
+            dest_st = os.stat(dest)
+            if (dest_st.st_size == src_st.st_size and
+                int(dest_st.st_mtime) == int(src_st.st_mtime)):
+                return None
+        except OSError:
+            pass
+        # Copy to a temporary file first, other processes may be reading
+        tmp_path = "%s.%d.tmp" % (dest, os.getpid())
+        shutil.copy2(src, tmp_path)
+        os.rename(tmp_path, dest)
+        return src_st.st_size
+
+    # Sync the local copy of the given folders (missing ones are ignored)
+    # Tuple: (files copied, bytes copied)
+    def sync(self, folders):
+        files, size = 0, 0
+        with self._lock:
+            for folder in folders:
+                if not os.path.isdir(folder):
+                    continue
+                for root, dirs, names in os.walk(folder):
+                    local_root = self.localPath(root)
+                    if not os.path.isdir(local_root):
+                        os.makedirs(local_root, mode=0o755)
+                    for name in names:
+                        copied = self._syncFile(os.path.join(root, name),
+                            os.path.join(local_root, name))
+                        if copied is not None:
+                            files += 1
+                            size += copied
+        return files, size
+
+    # Update the list of users of the copy (pids of the processes using it)
+    # under an exclusive lock, shared with the other processes on the host
+    # Return the number of users left
+    def _users(self, update):
+        parent = os.path.dirname(os.path.abspath(self._stage_dir))
+        if not os.path.isdir(parent):
+            os.makedirs(parent, mode=0o755)
+        users_path = self._stage_dir + ".users"
+        with open(self._stage_dir + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(users_path, "r") as users_file:
+                    users = set(int(l) for l in users_file if l.strip())
+            except IOError:
+                users = set()
+            users = set(pid for pid in update(users) if pid_alive(pid))
+            if users:
+                with open(users_path, "w") as users_file:
+                    users_file.write("".join("%d\n" % pid for pid in users))
+            else:
+                # Nobody is using the copy anymore
+                shutil.rmtree(self._stage_dir, ignore_errors=True)
+                if os.path.exists(users_path):
+                    os.remove(users_path)
+        return len(users)
+
+    # Register this process as a user of the copy
+    def acquire(self):
+        with self._lock:
+            self._users(lambda users: users | set([os.getpid()]))
+        return
+
+    # Unregister this process, removing the copy if it was the last user
+    # Return True if the copy has been removed
+    def release(self):
+        with self._lock:
+            return self._users(lambda users: users - set([os.getpid()])) == 0
+
+
+# Check if a process is running on this host
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
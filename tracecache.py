@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = "Tommaso Marinelli"
+__email__  = "tommarin@ucm.es"
+
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+
+""" Local cache of decompressed elastic traces. Each gzipped trace is
+decompressed only once in the cache folder (ideally on tmpfs), then shared by
+all the replay processes which use it. Entries are reference-counted, and the
+least recently used ones which are not in use are evicted whenever the total
+size exceeds the budget. If a trace cannot be decompressed (e.g. not enough
+space), the compressed file is used, since gem5 is able to read it anyway. """
+class TraceCache(object):
+    def __init__(self, cache_dir, budget):
+        self._dir     = cache_dir
+        self._budget  = budget
+        self._size    = 0
+        # Entry: [local path, size, references, last use, ready event]
+        self._entries = {}
+        self._lock    = threading.Lock()
+        if not os.path.isdir(self._dir):
+            os.makedirs(self._dir, mode=0o755)
+        return
+
+    def _localPath(self, path):
+        digest = hashlib.md5(path.encode("utf-8")).hexdigest()[:12]
+        name = os.path.basename(path)[:-len(".gz")]
+        return os.path.join(self._dir, "%s_%s" % (digest, name))
+
+    # Remove idle entries, least recently used first, until within budget
+    def _evict(self):
+        idle = sorted([(e[3], p) for p, e in self._entries.items()
+            if e[2] == 0 and e[4].is_set()])
+        for last_use, path in idle:
+            if self._size <= self._budget:
+                break
+            entry = self._entries.pop(path)
+            self._size -= entry[1]
+            try:
+                os.remove(entry[0])
+            except OSError:
+                pass
+        return
+
+    # Get the path of the decompressed trace, taking a reference to it, or
+    # the given path (without any reference to release) if not cached
+    def acquire(self, path):
+        if not path.endswith(".gz"):
+            return path
+        with self._lock:
+            entry = self._entries.get(path)
+            owner = entry is None
+            if owner:
+                entry = [self._localPath(path), 0, 0, 0,
+                         threading.Event()]
+                self._entries[path] = entry
+            entry[2] += 1
+            entry[3] = time.time()
+        if owner:
+            # Decompress the trace outside the lock
+            local_path = entry[0]
+            try:
+                with gzip.open(path, "rb") as f_in:
+                    with open(local_path + ".tmp", "wb") as f_out:
+                        shutil.copyfileobj(f_in, f_out, 2**20)
+                os.rename(local_path + ".tmp", local_path)
+                size = os.path.getsize(local_path)
+            except (IOError, OSError):
+                if os.path.exists(local_path + ".tmp"):
+                    os.remove(local_path + ".tmp")
+                local_path, size = None, 0
+            with self._lock:
+                if local_path is None:
+                    # Drop the entry, the compressed file will be used
+                    del self._entries[path]
+                else:
+                    entry[1] = size
+                    self._size += size
+                    self._evict()
+                entry[0] = local_path
+                entry[4].set()
+        else:
+            entry[4].wait()
+        if entry[0] is None:
+            # The entry has been dropped, along with the references to it
+            return path
+        return entry[0]
+
+    # Release a reference taken with acquire
+    def release(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return
+            entry[2] -= 1
+            entry[3] = time.time()
+            self._evict()
+        return
+
+    # Remove all the cached traces
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._size = 0
+        shutil.rmtree(self._dir, ignore_errors=True)
+        return